@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from app.db.models import User
+from app.api.deps import get_current_user
+from app.services.key_pool import KeyPool
+from app.services.llm import get_provider
+from app.services.metrics import metrics
+from app.services.quiz_generator import batch_sizer
+
+router = APIRouter(prefix="/generation", tags=["Generation"])
+
+
+@router.get("/batch-sizing")
+def get_batch_sizing(user: User = Depends(get_current_user)):
+    """Learned output tokens per question and the batch size each profile/topic gets."""
+    return batch_sizer.snapshot()
+
+
+@router.get("/key-pool")
+def get_key_pool(user: User = Depends(get_current_user)):
+    """Per-key quota left, circuit breaker state and call counts for both pools."""
+    pools = {}
+    for name, bulk in (("standard", False), ("bulk", True)):
+        provider = get_provider(bulk=bulk).provider
+        pools[name] = provider.snapshot() if isinstance(provider, KeyPool) else []
+    return pools
+
+
+@router.get("/metrics")
+def get_generation_metrics(user: User = Depends(get_current_user)):
+    """LLM call latency, token and error counts plus batch parse, dedup and refill counts."""
+    return metrics.snapshot()
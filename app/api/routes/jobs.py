@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from uuid import UUID
+from app.db.session import get_db
+from app.db.models import GenerationJob, User, resume
+from app.api.deps import get_current_user
+from app.schemas.prompt import PromptRequest, ResumePromptRequest
+from app.services.jobs import enqueue_job, get_job
+from app.services.quiz_assembly import requested_question_count
+
+router = APIRouter(prefix="/jobs", tags=["Generation Jobs"])
+
+
+def _job_status(job: GenerationJob) -> dict:
+    result = job.result or {}
+    return {
+        "job_id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "ids": result.get("ids", []),
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+@router.post("/generate", status_code=202)
+def enqueue_generation(payload: PromptRequest, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    """Queue a /generate/ run; poll GET /jobs/{job_id} for progress and the question ids."""
+    job = enqueue_job(
+        db, user.id, "general", payload.model_dump(mode="json"), requested_question_count(payload.prompt)
+    )
+    return _job_status(job)
+
+
+@router.post("/generate-from-resume", status_code=202)
+def enqueue_resume_generation(
+    data: ResumePromptRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a resume quiz; the finished job's result carries the new session_id."""
+    if not db.query(resume.id).filter(resume.id == data.resume_id).first():
+        raise HTTPException(status_code=404, detail="Resume not found")
+
+    job = enqueue_job(
+        db, current_user.id, "resume", data.model_dump(mode="json"), requested_question_count(data.user_prompt)
+    )
+    return _job_status(job)
+
+
+@router.get("/{job_id}")
+def get_generation_job(job_id: UUID, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    job = get_job(db, job_id, user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
@@ -1,22 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.services.quiz_generator import generate_large_quiz
+from app.core.config import settings
+from app.db.session import get_db, SessionLocal
+from app.services.quiz_generator import get_engine
 from app.crud import crud_question
-from app.db.models import Question,QuizSession,User,HostedSession
+from app.db.models import QuizSession,User,HostedSession
 from app.api.deps import get_current_user
-from pydantic import BaseModel
-from app.api.deps import get_current_user
-from typing import List
-from app.db.models import PromptResponse
-from app.services.quiz_generator import clean_markdown_json  # <-- IMPORT CLEANER
-import re
+from typing import Optional
+import asyncio
+import hmac
 import uuid
 import json
+import time
 from datetime import datetime, timedelta
 from app.schemas.prompt import PromptRequest  # Assuming you have a schema for the prompt request
-from fastapi_cache.decorator import cache
-from app.services.prompt_echancer import get_gemini_response  # Assuming you have a function to enhance prompts
+from app.schemas.question import QuestionBulkRequest
+from app.services.prompt_cache import store_question_ids
+from app.services.quiz_assembly import (
+    bank_surplus,
+    cache_scope,
+    generate_quiz,
+    load_cached_quiz,
+    pick_from_bank,
+    quiz_summary,
+    requested_question_count,
+    save_prompt_log,
+)
+from app.services.prompt_echancer import enhance_prompt as enhance_prompt_text
+from app.services.llm import track_usage
+from app.services.question_search import search_questions
+from app.services.question_transfer import import_stream, iter_export
+from app.services.question_cache import etag_matches, get_question_payloads, iter_question_payloads, question_etag
 
 
 
@@ -77,23 +93,37 @@ async def check_host_limit(db:Session=Depends(get_db),user:User=Depends(get_curr
     }
 
 
+async def _cancel_on_disconnect(request: Request, awaitable, poll_seconds: float = 0.5):
+    """Await `awaitable`, cancelling it if the client goes away first."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
 @router.post("/prompt_enhancer")
-def enhance_prompt(payload: PromptRequest, db: Session = Depends(get_db)):
+async def enhance_prompt(payload: PromptRequest, request: Request):
     """
-    Enhance user prompts for quiz generation using AI model
+    Enhance user prompts for quiz generation using AI model.
+    Recently enhanced prompts are answered from cache; an abandoned request
+    stops waiting on the model.
     """
     try:
         # Get enhanced prompt from Gemini
-        enhanced_prompt = get_gemini_response(payload.prompt)
+        enhanced_prompt = await _cancel_on_disconnect(request, enhance_prompt_text(payload.prompt))
         
         # Check for error responses from Gemini
         if enhanced_prompt.startswith("❌"):
             raise HTTPException(status_code=500, detail=enhanced_prompt)
         
-        # Here you could add database logging if needed
-        # Example: db.add(PromptLog(original=payload.prompt, enhanced=enhanced_prompt))
-        # db.commit()
-        
         return {"enhanced_prompt": enhanced_prompt}
         
     except HTTPException as he:
@@ -106,104 +136,223 @@ def enhance_prompt(payload: PromptRequest, db: Session = Depends(get_db)):
             status_code=500,
             detail="Internal server error during prompt enhancement"
         )
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _frontend_question(question_id: str, q: dict) -> dict:
+    return {
+        "id": question_id,
+        "question": q["question_text"],
+        "options": [q["option_a"], q["option_b"], q["option_c"], q["option_d"]],
+        "correctAnswer": q["correct_answer"].upper(),
+        "explanation": q["explanation"]
+    }
+
+
 @router.post("/generate/")
-@cache(expire=3600)  # Cache for 1 hour
-def generate_and_save_questions(payload: PromptRequest, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    try:
-        # Extract exact number from prompt using regex
-        match = re.search(r'\b(\d+)\b', payload.prompt)
-        total_questions = int(match.group(1)) if match else 30
-        
-        # Enforce minimum/maximum bounds
-        total_questions = min(25, min(total_questions, 10000))
-        
-        # Dynamic batch sizing
-        batch_size = min(20, total_questions)  # Never exceed requested total
-        
-        questions = generate_large_quiz(
-            payload.prompt, 
-            total_questions=total_questions,
-            batch_size=batch_size
-        )
-        
-        # Final count validation
-        if len(questions) != total_questions:
-            raise ValueError(f"Generated {len(questions)} instead of {total_questions} questions")
+async def generate_and_save_questions(payload: PromptRequest, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return await generate_quiz(db, payload, user.id)
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to generate quiz: {str(e)}")
 
-    created_questions = []
-    existing_questions = []
+@router.post("/generate/stream")
+async def generate_and_stream_questions(payload: PromptRequest, user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events variant of /generate/. Model output is parsed as it streams,
+    and each validated group of questions is saved and emitted as a `batch` event
+    as soon as it arrives, so the first question renders well within one batch's
+    latency. The stream ends with a `done` event carrying the same summary as
+    /generate/, or an `error` event. A cached prompt is sent as a single batch,
+    and unseen bank questions go out as the first batch before any LLM output.
+    """
+    total_questions = requested_question_count(payload.prompt)
 
-    for q in questions:
-        if "question_text" not in q:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Invalid question format: missing question_text in {q}"
+    async def event_stream():
+        # Request-scoped dependencies are closed before a streamed body runs,
+        # so the stream owns its own session. Its queries run in the threadpool
+        # so they never hold up the event loop.
+        db = SessionLocal()
+        questions = []
+        all_question_ids = []
+        created_count = 0
+        existing_count = 0
+        try:
+            cached = None if payload.fresh else await run_in_threadpool(
+                load_cached_quiz, db, payload.prompt, total_questions, user.id, cache_scope(payload)
             )
-        q["company"] = q.get("company", "Unknown")
-        q["topic"] = q.get("topic", "General")
-        q["difficulty"] = q.get("difficulty", "Easy")
+            if cached is not None:
+                cached_ids, cached_questions = cached
+                yield _sse_event("batch", {
+                    "questions": [_frontend_question(i, q) for i, q in zip(cached_ids, cached_questions)],
+                    "progress": len(cached_ids),
+                    "total": total_questions
+                })
+                yield _sse_event("done", quiz_summary(
+                    payload.prompt, cached_questions, cached_ids, 0, len(cached_ids), cached=True
+                ))
+                return
+
+            bank_ids, bank_questions = await run_in_threadpool(pick_from_bank, db, payload, user.id, total_questions)
+            if bank_ids:
+                all_question_ids.extend(bank_ids)
+                existing_count += len(bank_ids)
+                questions.extend(bank_questions)
+                yield _sse_event("batch", {
+                    "questions": [_frontend_question(i, q) for i, q in zip(bank_ids, bank_questions)],
+                    "progress": len(questions),
+                    "total": total_questions
+                })
+
+            remaining = total_questions - len(bank_ids)
+            generated_ids, surplus = [], []
+            started = time.perf_counter()
+            with track_usage(capture_raw=settings.PROMPT_LOG_STORE_RAW) as usage:
+                async for batch in get_engine().iter_large_quiz(
+                    payload.prompt,
+                    total_questions=remaining,
+                    stream=True,
+                    exclude=[q["question_text"] for q in bank_questions],
+                    surplus=surplus
+                ):
+                    batch_ids, created, existing = await run_in_threadpool(
+                        crud_question.save_generated_questions, db, batch
+                    )
+                    all_question_ids.extend(batch_ids)
+                    created_count += len(created)
+                    existing_count += len(existing)
+                    questions.extend(batch)
+                    generated_ids.extend(batch_ids)
+                    yield _sse_event("batch", {
+                        "questions": [_frontend_question(i, q) for i, q in zip(batch_ids, batch)],
+                        "progress": len(questions),
+                        "total": total_questions
+                    })
+
+            if len(questions) != total_questions:
+                raise ValueError(f"Generated {len(questions)} instead of {total_questions} questions")
+
+            seconds = time.perf_counter() - started
+
+            def finish():
+                if generated_ids:
+                    save_prompt_log(db, payload.prompt, generated_ids, usage, seconds)
+                store_question_ids(db, payload.prompt, all_question_ids, cache_scope(payload))
+                bank_surplus(db, surplus)
+
+            await run_in_threadpool(finish)
+
+            yield _sse_event("done", quiz_summary(
+                payload.prompt, questions, all_question_ids, created_count, existing_count,
+                bank_count=len(bank_ids)
+            ))
+        except HTTPException as he:
+            yield _sse_event("error", {"detail": he.detail})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Failed to generate quiz: {str(e)}"})
+        finally:
+            await run_in_threadpool(db.close)
 
-        existing = db.query(Question).filter(Question.question_text == q["question_text"]).first()
-        if existing:
-            existing_questions.append(str(existing.id))
-        else:
-            created = crud_question.create_question(db, q)
-            created_questions.append(str(created.id))
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    all_question_ids = created_questions + existing_questions
+def require_transfer_token(x_transfer_token: Optional[str] = Header(None)):
+    if not settings.QUESTION_TRANSFER_TOKEN:
+        raise HTTPException(status_code=403, detail="Question transfer is disabled")
+    if not x_transfer_token or not hmac.compare_digest(x_transfer_token, settings.QUESTION_TRANSFER_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid transfer token")
 
-    # 🚀 Save prompt and clean FULL response for fine-tuning later
+
+@router.get("/export", dependencies=[Depends(require_transfer_token)])
+def export_questions():
+    """The whole question bank as NDJSON, streamed through a server-side cursor."""
+    def body():
+        # The stream outlives the request's dependencies, so it opens its own session
+        db = SessionLocal()
+        try:
+            yield from iter_export(db)
+        finally:
+            db.close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.post("/import", dependencies=[Depends(require_transfer_token)])
+async def import_questions(request: Request, db: Session = Depends(get_db)):
+    """
+    Load an NDJSON export sent as the request body, in batches as it streams in.
+    Questions already stored (same content hash or id) are skipped.
+    """
+    return await import_stream(db, request.stream())
+
+
+@router.get("/search")
+def search_question_bank(
+    q: str = Query(..., min_length=1, max_length=200),
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    company: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """Ranked full-text search over the bank; pass `next_cursor` back as `cursor` for the next page."""
     try:
-        db.add(PromptResponse(prompt=payload.prompt, response=questions))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to save prompt/response: {str(e)}")
+        return search_questions(db, q, topic, difficulty, company, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/bulk")
+def get_questions_bulk(payload: QuestionBulkRequest):
+    """
+    POST variant of GET /questions/{question_ids} for id lists too long for a
+    URL. Rows are fetched in chunked IN queries and streamed out as one JSON
+    array in the requested order, so memory stays bounded for any length.
+    """
+    ids = list(payload.ids)
+
+    def body():
+        # The request's dependencies are torn down before streaming starts,
+        # so the stream owns its own session.
+        db = SessionLocal()
+        try:
+            yield "["
+            for n, question in enumerate(iter_question_payloads(db, ids)):
+                yield question if n == 0 else "," + question
+            yield "]"
+        finally:
+            db.close()
+
+    return StreamingResponse(body(), media_type="application/json")
 
-    return {
-        "message": "Questions processed successfully!",
-        "new_questions": len(created_questions),
-        "existing_questions": len(existing_questions),
-        "prompt": payload.prompt,
-        "topics": [q["topic"] for q in questions],
-        "difficulties": [q["difficulty"] for q in questions],
-        "companies": [q["company"] for q in questions],
-        "ids": all_question_ids
-    }
 
 @router.get("/{question_ids}")
-def get_questions(question_ids: str, db: Session = Depends(get_db)):
+def get_questions(question_ids: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Questions by comma-separated ids, in the order asked; unknown ids are left out.
+    Stored questions never change, so a complete response is sent as immutable
+    with a strong ETag, and a matching If-None-Match gets a 304 without a lookup.
+    """
     try:
         # Convert comma-separated string of IDs to list of UUIDs
         ids = [uuid.UUID(id.strip()) for id in question_ids.split(',')]
-
-        # Fetch questions from database
-        questions = crud_question.get_questions_by_ids(db, ids)
-
-        # Instead of 404, return only found ones
-        if not questions:
-            return []  # ⬅️ Return empty list if none found
-
-        # Transform for frontend
-        transformed_questions = []
-        for q in questions:
-            transformed_questions.append({
-                "id": str(q.id),
-                "question": q.question_text,
-                "options": [
-                    q.option_a,
-                    q.option_b,
-                    q.option_c,
-                    q.option_d
-                ],
-                "correctAnswer": q.correct_answer.upper(),
-                "explanation": q.explanation
-            })
-
-        return transformed_questions
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid question IDs format")
 
+    etag = question_etag(ids)
+    immutable = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.QUESTION_CACHE_MAX_AGE_SECONDS}, immutable",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=immutable)
+
+    payloads = get_question_payloads(db, ids)
+    # Ids that don't exist (yet) must not be cached as a permanent answer
+    headers = immutable if len(payloads) == len(ids) else {"Cache-Control": "no-cache"}
+    return Response(content="[" + ",".join(payloads) + "]", media_type="application/json", headers=headers)
+
@@ -303,17 +303,7 @@ async def join_hosted_session(
         print(f"Created new JoinedQuizSession {participant_specific_quiz_session_id} for user {current_user.id} for hosted_session {hosted_session_id}")
 
         # Link questions from HostedQuizSessionQuestion to the new JoinedQuizSessionQuestion
-        template_questions = db.query(HostedQuizSessionQuestion).filter(
-            HostedQuizSessionQuestion.hosted_session_id == template_hosted_quiz_session.id
-        ).order_by(HostedQuizSessionQuestion.question_order).all()
-
-        for hq_question in template_questions:
-            new_qs_question = JoinedQuizSessionQuestion(
-                joined_session_id=participant_specific_quiz_session_id,
-                question_id=hq_question.question_id,
-                question_order=hq_question.question_order
-            )
-            db.add(new_qs_question)
+        crud_quiz.copy_hosted_question_links(db, template_hosted_quiz_session.id, participant_specific_quiz_session_id)
     
     db.commit()
     
@@ -7,12 +7,72 @@ if os.path.exists(env_path):
 else:
     print(f"Warning: .env file not found at {env_path}")
 
+def _key_list(value: str) -> list:
+    return [key.strip() for key in (value or "").split(",") if key.strip()]
+
+
 class Settings:
     PROJECT_NAME: str = "Quiz Platform"
     ENV: str = os.getenv("ENV", "development")
     DEBUG: bool = ENV == "development"
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "your-default-or-dev-key")
     BULK_GOOGLE_API_KEY: str = os.getenv("BULK_GOOGLE_API_KEY", "your-default-or-dev-key")
+    # Comma-separated key pools; default to the single keys above
+    GOOGLE_API_KEYS: list = _key_list(os.getenv("GOOGLE_API_KEYS")) or [GOOGLE_API_KEY]
+    BULK_GOOGLE_API_KEYS: list = _key_list(os.getenv("BULK_GOOGLE_API_KEYS")) or [BULK_GOOGLE_API_KEY]
+    # Per-key Gemini quota, retries and circuit breaker
+    GEMINI_KEY_RPM: int = int(os.getenv("GEMINI_KEY_RPM", "15"))
+    GEMINI_KEY_TPM: int = int(os.getenv("GEMINI_KEY_TPM", "1000000"))
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    GEMINI_BREAKER_FAILURES: int = int(os.getenv("GEMINI_BREAKER_FAILURES", "3"))
+    GEMINI_BREAKER_RESET_SECONDS: float = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+    # "gemini" for the real API, "fake" for the deterministic offline provider,
+    # "replay" to serve the responses recorded in LLM_CASSETTE
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "gemini")
+    LLM_CASSETTE: str = os.getenv("LLM_CASSETTE", "cassette.jsonl")
+    # When set, live Gemini responses are appended to this cassette file
+    LLM_RECORD_CASSETTE: str = os.getenv("LLM_RECORD_CASSETTE", "")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    FAKE_LLM_LATENCY_MS: int = int(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+    # Generation result cache: in-process tier and DB tier lifetimes
+    PROMPT_CACHE_SIZE: int = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+    PROMPT_CACHE_TTL_SECONDS: int = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+    PROMPT_CACHE_DB_TTL_SECONDS: int = int(os.getenv("PROMPT_CACHE_DB_TTL_SECONDS", str(7 * 24 * 3600)))
+    # Prompt topics BatchSizer keeps learned batch sizes for; least recently used are dropped
+    BATCH_SIZING_MAX_TOPICS: int = int(os.getenv("BATCH_SIZING_MAX_TOPICS", "1000"))
+    # /prompt_enhancer result cache
+    PROMPT_ENHANCER_CACHE_SIZE: int = int(os.getenv("PROMPT_ENHANCER_CACHE_SIZE", "2048"))
+    PROMPT_ENHANCER_CACHE_TTL_SECONDS: int = int(os.getenv("PROMPT_ENHANCER_CACHE_TTL_SECONDS", str(24 * 3600)))
+    # Read cache of question payloads by id (questions never change once stored);
+    # set QUESTION_CACHE_REDIS_URL to share it across workers
+    QUESTION_CACHE_SIZE: int = int(os.getenv("QUESTION_CACHE_SIZE", "20000"))
+    QUESTION_CACHE_REDIS_URL: str = os.getenv("QUESTION_CACHE_REDIS_URL", "")
+    QUESTION_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("QUESTION_CACHE_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+    # Shared secret for /questions/export and /questions/import (X-Transfer-Token);
+    # both are disabled while it's unset
+    QUESTION_TRANSFER_TOKEN: str = os.getenv("QUESTION_TRANSFER_TOKEN", "")
+    # Generation log (prompt_logs): keep the raw model output too, and for how long
+    PROMPT_LOG_STORE_RAW: bool = os.getenv("PROMPT_LOG_STORE_RAW", "false").lower() == "true"
+    PROMPT_LOG_RETENTION_DAYS: int = int(os.getenv("PROMPT_LOG_RETENTION_DAYS", "90"))
+    # Background generation jobs
+    GENERATION_WORKERS: int = int(os.getenv("GENERATION_WORKERS", "4"))
+    GENERATION_JOB_POLL_SECONDS: float = float(os.getenv("GENERATION_JOB_POLL_SECONDS", "2"))
+    GENERATION_JOB_STALE_SECONDS: int = int(os.getenv("GENERATION_JOB_STALE_SECONDS", "300"))
+    GENERATION_JOB_MAX_ATTEMPTS: int = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+    # Coalescing of identical in-flight generations: "database" works across
+    # uvicorn workers, "local" only within one process
+    SINGLE_FLIGHT_BACKEND: str = os.getenv("SINGLE_FLIGHT_BACKEND", "database")
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_SECONDS", "300"))
+    SINGLE_FLIGHT_POLL_SECONDS: float = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", "1"))
+    # Background pre-generation of question pools for hot topics; it spends bulk
+    # keys unprompted, so it's opt-in. The hourly budget is for the whole deployment.
+    PREGEN_ENABLED: bool = os.getenv("PREGEN_ENABLED", "false").lower() == "true"
+    PREGEN_INTERVAL_SECONDS: float = float(os.getenv("PREGEN_INTERVAL_SECONDS", "60"))
+    PREGEN_HOT_TOPICS: int = int(os.getenv("PREGEN_HOT_TOPICS", "8"))
+    PREGEN_POOL_SIZE: int = int(os.getenv("PREGEN_POOL_SIZE", "50"))
+    PREGEN_MAX_QUESTIONS_PER_HOUR: int = int(os.getenv("PREGEN_MAX_QUESTIONS_PER_HOUR", "200"))
+    PREGEN_WINDOW_DAYS: int = int(os.getenv("PREGEN_WINDOW_DAYS", "7"))
+    PREGEN_PROMPT_SAMPLE: int = int(os.getenv("PREGEN_PROMPT_SAMPLE", "500"))
     DATABASE_URL: str = os.getenv("DATABASE_URL")
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "supersecretkey")
     SECRET_KEY: str = os.getenv("SECRET_KEY")  # Removed trailing comma
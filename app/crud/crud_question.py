@@ -1,45 +1,282 @@
+from fastapi import HTTPException
+from sqlalchemy import func, select, union
 from sqlalchemy.orm import Session
-from app.db.models import Question
+from app.db.models import (
+    Question,
+    QuizSession,
+    QuizSessionQuestion,
+    JoinedQuizSession,
+    JoinedQuizSessionQuestion,
+)
+from app.services.dedup import question_hash
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
+# Rows per INSERT; keeps a 10k-question quiz under Postgres' bind parameter limit
+INSERT_CHUNK_SIZE = 1000
+# Ids per IN (...) when fetching questions by id
+FETCH_CHUNK_SIZE = 500
 
-def question_exists(db: Session, question_text: str) -> bool:
-    """Check if a question with the same text already exists in the database."""
-    existing_question = db.query(Question).filter(Question.question_text == question_text).first()
-    return existing_question is not None
+# Every stored (lowercase) difficulty meaning the same level; the generator
+# writes "advanced"/"expert", older rows and defaults use "easy"/"medium"/"hard"
+_DIFFICULTY_LEVELS = (
+    ("easy", "beginner", "basic"),
+    ("medium", "intermediate"),
+    ("advanced", "hard", "difficult"),
+    ("expert",),
+)
+DIFFICULTY_ALIASES = {alias: level for level in _DIFFICULTY_LEVELS for alias in level}
+
+
+def difficulty_values(difficulty: str) -> Tuple[str, ...]:
+    """Stored difficulty values that `difficulty` (any case, any alias) stands for."""
+    difficulty = difficulty.lower()
+    return DIFFICULTY_ALIASES.get(difficulty, (difficulty,))
+
+
+def question_exists(db: Session, question_data: dict) -> bool:
+    """Check if a question with the same text, options and answer already exists in the database."""
+    return db.query(Question.id).filter(Question.hash == question_hash(question_data)).first() is not None
+
+
+def question_row(question_data: dict, created_by: str = None) -> dict:
+    """Column values for a new questions row, with a fresh id and the content hash."""
+    return {
+        "id": uuid.uuid4(),
+        "hash": question_hash(question_data),
+        "question_text": question_data["question_text"],
+        "option_a": question_data["option_a"],
+        "option_b": question_data["option_b"],
+        "option_c": question_data["option_c"],
+        "option_d": question_data["option_d"],
+        "correct_answer": question_data["correct_answer"],
+        "explanation": question_data["explanation"],
+        "topic": question_data.get("topic", ""),
+        "difficulty": question_data.get("difficulty", ""),
+        "company": question_data.get("company", ""),
+        "created_by": created_by,
+        "created_at": datetime.utcnow(),
+    }
 
 
 def create_question(db: Session, question_data: dict, created_by: str = None) -> Question:
-    # Check if question already exists
-    if question_exists(db, question_data["question_text"]):
-        # Return existing question or None depending on your preference
-        return db.query(Question).filter(Question.question_text == question_data["question_text"]).first()
-    
-    # If question doesn't exist, create a new one
-    question = Question(
-        id=uuid.uuid4(),
-        hash=str(uuid.uuid4()),
-        question_text=question_data["question_text"],
-        option_a=question_data["option_a"],
-        option_b=question_data["option_b"],
-        option_c=question_data["option_c"],
-        option_d=question_data["option_d"],
-        correct_answer=question_data["correct_answer"],
-        explanation=question_data["explanation"],
-        topic=question_data.get("topic", ""),
-        difficulty=question_data.get("difficulty",""),
-        company=question_data.get("company", ""),
-        created_by=created_by,
-        created_at=datetime.utcnow()
-    )
+    # Same text, options and answer (up to case and spacing) means the same row
+    row = question_row(question_data, created_by)
+    existing = db.query(Question).filter(Question.hash == row["hash"]).first()
+    if existing is not None:
+        return existing
+
+    question = Question(**row)
     db.add(question)
     db.commit()
     db.refresh(question)
     return question
 
 
+def _insert(db: Session):
+    """The dialect's INSERT, which supports ON CONFLICT DO NOTHING ... RETURNING."""
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(Question)
+
+
+def upsert_questions(db: Session, rows: List[dict]) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Insert question rows, skipping any whose hash is already stored, with one
+    INSERT ... ON CONFLICT (hash) DO NOTHING RETURNING per chunk and one lookup
+    of the rows that were already there. Does not commit.
+    Returns ({hash: question id} for every row, hashes that were inserted).
+    """
+    ids: Dict[str, str] = {}
+    created = set()
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        statement = (
+            _insert(db)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=[Question.hash])
+            .returning(Question.id, Question.hash)
+        )
+        for question_id, digest in db.execute(statement):
+            ids[digest] = str(question_id)
+            created.add(digest)
+
+    missing = [row["hash"] for row in rows if row["hash"] not in ids]
+    if missing:
+        for question_id, digest in db.query(Question.id, Question.hash).filter(Question.hash.in_(missing)):
+            ids[digest] = str(question_id)
+    return ids, created
+
+
+def backfill_question_hashes(db: Session, batch_size: int = 500) -> int:
+    """
+    Recompute Question.hash for every stored question, walking the table in id
+    order. Rows stored before it was a content digest hold a random uuid, and
+    earlier digests covered only the normalized text. Rows whose content is
+    already stored under its digest get "<digest>:<id>" so the unique index
+    holds. Returns rows updated.
+    """
+    columns = (Question.question_text, Question.option_a, Question.option_b,
+               Question.option_c, Question.option_d, Question.correct_answer)
+    updated = 0
+    last_id = None
+    while True:
+        query = db.query(Question.id, Question.hash, *columns).order_by(Question.id)
+        if last_id is not None:
+            query = query.filter(Question.id > last_id)
+        rows = query.limit(batch_size).all()
+        if not rows:
+            return updated
+        last_id = rows[-1].id
+
+        digests = {}
+        for row in rows:
+            digest = question_hash(row._asdict())
+            if row.hash not in (digest, f"{digest}:{row.id.hex}"):
+                digests[row.id] = digest
+        if not digests:
+            continue
+        taken = {
+            digest for (digest,) in
+            db.query(Question.hash).filter(Question.hash.in_(set(digests.values())))
+        }
+        mappings = []
+        for question_id, digest in digests.items():
+            if digest in taken:
+                digest = f"{digest}:{question_id.hex}"
+            taken.add(digest)
+            mappings.append({"id": question_id, "hash": digest})
+        db.bulk_update_mappings(Question, mappings)
+        db.commit()
+        updated += len(mappings)
+
+
+def iter_questions_by_ids(
+    db: Session, question_ids: List[uuid.UUID], chunk_size: int = FETCH_CHUNK_SIZE
+) -> Iterator[List[Question]]:
+    """
+    Questions for `question_ids` one chunk at a time, each chunk a single IN
+    query returned in the requested order. Unknown ids are skipped; repeated
+    ids repeat the row.
+    """
+    for start in range(0, len(question_ids), chunk_size):
+        chunk = question_ids[start:start + chunk_size]
+        rows = {q.id: q for q in db.query(Question).filter(Question.id.in_(set(chunk)))}
+        yield [rows[i] for i in chunk if i in rows]
+
+
 def get_questions_by_ids(db: Session, question_ids: List[uuid.UUID]) -> List[Question]:
-    questions = db.query(Question).filter(Question.id.in_(question_ids)).all()
-    return questions
+    """Questions for `question_ids` in the requested order; unknown ids are skipped."""
+    return [q for chunk in iter_questions_by_ids(db, question_ids) for q in chunk]
+
+
+def _seen_by(user_id: uuid.UUID):
+    """Ids of every question the user had in one of their own or joined quiz sessions."""
+    return union(
+        select(QuizSessionQuestion.question_id)
+        .join(QuizSession, QuizSession.id == QuizSessionQuestion.quiz_session_id)
+        .where(QuizSession.user_id == user_id, QuizSessionQuestion.question_id.isnot(None)),
+        select(JoinedQuizSessionQuestion.question_id)
+        .join(JoinedQuizSession, JoinedQuizSession.id == JoinedQuizSessionQuestion.joined_session_id)
+        .where(JoinedQuizSession.user_id == user_id, JoinedQuizSessionQuestion.question_id.isnot(None)),
+    )
+
+
+def any_seen(db: Session, user_id: uuid.UUID, question_ids: List[uuid.UUID]) -> bool:
+    """Whether the user already had any of `question_ids` in a quiz session."""
+    if not question_ids:
+        return False
+    seen = _seen_by(user_id).subquery()
+    return db.query(seen.c.question_id).filter(seen.c.question_id.in_(set(question_ids))).first() is not None
+
+
+def get_unseen_questions(
+    db: Session,
+    user_id: uuid.UUID,
+    limit: int,
+    topic: str,
+    difficulty: Optional[str] = None,
+    company: Optional[str] = None,
+) -> List[Question]:
+    """
+    Bank questions matching the (case-insensitive) filters that the user has not
+    had in any of their own or joined quiz sessions, newest first. A difficulty
+    matches every stored value of its level ("hard" finds "advanced" too).
+    """
+    if limit <= 0:
+        return []
+
+    seen = _seen_by(user_id)
+    query = db.query(Question).filter(func.lower(Question.topic) == topic.lower())
+    if difficulty:
+        query = query.filter(func.lower(Question.difficulty).in_(difficulty_values(difficulty)))
+    if company:
+        query = query.filter(func.lower(Question.company) == company.lower())
+
+    return (
+        query.filter(Question.id.notin_(seen))
+        .order_by(Question.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def count_unused_questions(db: Session, topic: str, difficulty: Optional[str] = None) -> int:
+    """Bank questions matching the (case-insensitive) filters that no quiz session has used yet."""
+    used = union(
+        select(QuizSessionQuestion.question_id).where(QuizSessionQuestion.question_id.isnot(None)),
+        select(JoinedQuizSessionQuestion.question_id).where(JoinedQuizSessionQuestion.question_id.isnot(None)),
+    )
+    query = db.query(func.count(Question.id)).filter(func.lower(Question.topic) == topic.lower())
+    if difficulty:
+        query = query.filter(func.lower(Question.difficulty).in_(difficulty_values(difficulty)))
+    return query.filter(Question.id.notin_(used)).scalar() or 0
+
+
+def save_generated_questions(
+    db: Session,
+    questions: List[dict],
+    default_topic: str = "General",
+    default_difficulty: str = "Easy",
+):
+    """
+    Persist generated questions with a single upsert on their content hash, so
+    a question already in the bank (same text, options and answer up to case
+    and spacing) reuses that row. Near-duplicates are never merged here: a rephrasing can
+    have a different answer, so dropping those is left to generation.
+    Returns (ids in question order, created ids, existing ids).
+    """
+    rows: Dict[str, dict] = {}
+    for q in questions:
+        if "question_text" not in q:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Invalid question format: missing question_text in {q}"
+            )
+        q["company"] = q.get("company", "Unknown")
+        q["topic"] = q.get("topic", default_topic)
+        q["difficulty"] = q.get("difficulty", default_difficulty)
+        row = question_row(q)
+        rows.setdefault(row["hash"], row)
+
+    ids, created = {}, set()
+    if rows:
+        ids, created = upsert_questions(db, list(rows.values()))
+        db.commit()
+
+    question_ids = []
+    created_questions = []
+    existing_questions = []
+    for q in questions:
+        digest = question_hash(q)
+        question_id = ids[digest]
+        if digest in created and question_id not in created_questions:
+            created_questions.append(question_id)
+        else:
+            existing_questions.append(question_id)
+        question_ids.append(question_id)
+
+    return question_ids, created_questions, existing_questions
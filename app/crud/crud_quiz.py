@@ -1,6 +1,8 @@
+from sqlalchemy import func, insert, literal, select
 from sqlalchemy.orm import Session
 from uuid import uuid4, UUID
 from datetime import datetime
+from typing import List
 import uuid
 
 from app.db.models import (
@@ -10,11 +12,65 @@ from app.db.models import (
     HostedQuizSession,
     HostedQuizSessionQuestion,
     HostedSession,
-    HostedSessionParticipant
+    HostedSessionParticipant,
+    JoinedQuizSessionQuestion,
 )
 from app.schemas.quiz_session import QuizSessionCreate, HostedSessionCreate
 from app.schemas.user_answer import UserAnswerCreate
 
+def _new_link_id(db: Session):
+    """A per-row id generated by the database, or None where rows get a Python uuid4."""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.gen_random_uuid()
+    return None
+
+
+def insert_question_links(db: Session, model, session_column: str, session_id: UUID, question_ids: List[UUID]) -> None:
+    """
+    Link a session to its questions in order (question_order from 1) with one
+    executemany INSERT, without building an ORM object per link. The driver
+    batches it (insertmanyvalues) with a single cached statement. The session
+    row must already be flushed.
+    """
+    statement = insert(model.__table__)
+    new_id = _new_link_id(db)
+    if new_id is not None:
+        statement = statement.values(id=new_id)
+    db.execute(statement, [
+        {session_column: session_id, "question_id": question_id, "question_order": order}
+        for order, question_id in enumerate(question_ids, start=1)
+    ])
+
+
+def copy_hosted_question_links(db: Session, hosted_quiz_session_id: UUID, joined_session_id: UUID) -> None:
+    """Give a participant's joined session the hosted quiz's questions with one INSERT ... SELECT."""
+    new_id = _new_link_id(db)
+    if new_id is None:
+        # 32 hex digits, the form SQLite stores uuids in
+        new_id = func.lower(func.hex(func.randomblob(16)))
+    rows = select(
+        new_id,
+        literal(joined_session_id, JoinedQuizSessionQuestion.joined_session_id.type),
+        HostedQuizSessionQuestion.question_id,
+        HostedQuizSessionQuestion.question_order,
+    ).where(HostedQuizSessionQuestion.hosted_session_id == hosted_quiz_session_id)
+    db.execute(insert(JoinedQuizSessionQuestion).from_select(
+        ["id", "joined_session_id", "question_id", "question_order"], rows
+    ))
+
+
+def _commit_keeping_loaded(db: Session) -> None:
+    """
+    Commit without expiring what was just written, so returning the new rows
+    needs no refresh: every column was set or defaulted on the Python side.
+    """
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
 
 def create_quiz_session(db: Session, user_id: UUID, session_data: QuizSessionCreate):
 
@@ -34,19 +90,11 @@ def create_quiz_session(db: Session, user_id: UUID, session_data: QuizSessionCre
         submitted_at=None
     )
     db.add(session)
-    db.flush()  # So we get session.id
+    db.flush()  # The links reference the session row
 
-    for idx, qid in enumerate(session_data.question_ids):
-        session_question = QuizSessionQuestion(
-            id=uuid.uuid4(),
-            quiz_session_id=session.id,
-            question_id=qid,
-            question_order=idx + 1,
-        )
-        db.add(session_question)
+    insert_question_links(db, QuizSessionQuestion, "quiz_session_id", session.id, session_data.question_ids)
 
-    db.commit()
-    db.refresh(session)
+    _commit_keeping_loaded(db)
     return session
 
 
@@ -105,13 +153,7 @@ def create_hosted_session(
     db.flush()
 
     # 2. link questions
-    for idx, qid in enumerate(data.question_ids, start=1):
-        db.add(HostedQuizSessionQuestion(
-            id=uuid4(),
-            hosted_session_id=hqs.id,
-            question_id=qid,
-            question_order=idx
-        ))
+    insert_question_links(db, HostedQuizSessionQuestion, "hosted_session_id", hqs.id, data.question_ids)
 
     # 3. create live room
     hs = HostedSession(
@@ -125,8 +167,8 @@ def create_hosted_session(
         created_at=datetime.utcnow()
     )
     db.add(hs)
-    db.commit()
-    db.refresh(hs)
+    db.flush()
+    _commit_keeping_loaded(db)
     return hs
 
 
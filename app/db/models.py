@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Float,JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Float,JSON, Index, LargeBinary, func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 import uuid
@@ -45,11 +45,19 @@ class Question(Base):
 
     created_user = relationship("User", backref="questions")
 
+    __table_args__ = (
+        # Bank retrieval filters on case-insensitive topic / difficulty / company
+        Index(
+            "ix_questions_bank_filters",
+            func.lower(topic), func.lower(difficulty), func.lower(company),
+        ),
+    )
+
 
 class QuizSession(Base):
     __tablename__ = "quiz_sessions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     prompt = Column(Text, nullable=False)
     topic = Column(String(100))
     difficulty = Column(String(100))
@@ -68,7 +76,7 @@ class QuizSession(Base):
 class QuizSessionQuestion(Base):
     __tablename__ = "quiz_session_questions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    quiz_session_id = Column(UUID(as_uuid=True), ForeignKey("quiz_sessions.id"))
+    quiz_session_id = Column(UUID(as_uuid=True), ForeignKey("quiz_sessions.id"), index=True)
     question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"))
     question_order = Column(Integer)
     quiz_session = relationship("QuizSession", back_populates="questions")
@@ -99,12 +107,82 @@ class resume(Base):
     user = relationship("User", backref="resumes")
 
 class PromptResponse(Base):
+    # Legacy full-JSON prompt log; new generations are logged in prompt_logs
     __tablename__ = "prompt_responses"
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True) 
     prompt = Column(String, index=True)
     response = Column(JSON)
 
+
+class PromptLog(Base):
+    """One generation: its prompt, the ids of the questions it produced and what it cost."""
+    __tablename__ = "prompt_logs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    prompt = Column(Text, nullable=False)
+    # Ordered ids in questions; the questions themselves aren't copied
+    question_ids = Column(JSON, nullable=False)
+    model = Column(String(100))
+    llm_calls = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer)
+    # zlib-compressed JSON list of the raw model responses, when PROMPT_LOG_STORE_RAW is on
+    raw_response = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow, index=True)
+
+class PromptCacheEntry(Base):
+    __tablename__ = "prompt_cache"
+
+    # sha256 of the normalized prompt key
+    key_hash = Column(String(64), primary_key=True)
+    prompt_key = Column(Text, nullable=False)
+    question_ids = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String(20), nullable=False)  # "general" or "resume"
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    progress = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Refreshed while a worker holds the job; a stale one means the worker died
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created_at", status, created_at),
+    )
+
+class GenerationLock(Base):
+    __tablename__ = "generation_locks"
+
+    # sha256 of the single-flight key; the row exists while one worker generates it
+    key_hash = Column(String(64), primary_key=True)
+    owner = Column(String(64), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    # A leader that died leaves its row behind; past this it can be taken over
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+class PregenerationSpend(Base):
+    """Questions one pre-generation batch produced; the last hour's rows make up the shared budget."""
+    __tablename__ = "pregeneration_spend"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    questions = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow, index=True)
+
 class HostedQuizSession(Base):
     __tablename__ = "hosted_quiz_sessions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -179,7 +257,7 @@ class HostedSessionLeaderboard(Base):
 class JoinedQuizSessionQuestion(Base):
     __tablename__ = "joined_quiz_session_questions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    joined_session_id = Column(UUID(as_uuid=True), ForeignKey("joined_quiz_sessions.id"))
+    joined_session_id = Column(UUID(as_uuid=True), ForeignKey("joined_quiz_sessions.id"), index=True)
     question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"))
     question_order = Column(Integer)
 
@@ -201,7 +279,7 @@ class JoinedUserAnswer(Base):
 class JoinedQuizSession(Base):
     __tablename__ = "joined_quiz_sessions"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     prompt = Column(Text, nullable=False)
     topic = Column(String(100))
     difficulty = Column(String(100))
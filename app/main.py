@@ -4,8 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.db.session import get_db
 from app.db.models import Base
 from app.db.session import engine
+from app.services.question_search import search_index_exists
 
-from app.api.routes import auth, users, questions, quiz_sessions, answers,user_stats,quiz_result,quiz_resume
+from app.api.routes import auth, users, questions, quiz_sessions, answers,user_stats,quiz_result,quiz_resume,jobs,generation
+from app.services.jobs import start_workers, stop_workers
+from app.services.pregeneration import start_pregeneration, stop_pregeneration
 from app.api.routes import api_router
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -36,8 +39,35 @@ app.include_router(answers)
 app.include_router(user_stats.router)
 app.include_router(quiz_result.router)
 app.include_router(quiz_resume.router)
+app.include_router(jobs.router)
+app.include_router(generation.router)
 #app.include_router(save_prompt_response.router)
 app.include_router(api_router)
+
+
+@app.on_event("startup")
+def check_search_index():
+    # Building it is a one-off (python -m app.manage build-search-index);
+    # search is slow (Postgres) or unavailable (SQLite) until then
+    try:
+        if not search_index_exists(engine):
+            print("Question search index is missing; run: python -m app.manage build-search-index")
+    except Exception as e:
+        print(f"Question search index check failed: {str(e)}")
+
+
+@app.on_event("startup")
+async def start_generation_workers():
+    start_workers()
+    start_pregeneration()
+
+
+@app.on_event("shutdown")
+async def stop_generation_workers():
+    await stop_pregeneration()
+    await stop_workers()
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the Quiz Platform API"}
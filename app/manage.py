@@ -0,0 +1,116 @@
+"""
+One-off maintenance commands for the database.
+
+They scan or rewrite whole tables, so they run once per deployment (e.g. as
+a release step), never in a worker's startup.
+
+    python -m app.manage backfill-hashes
+    python -m app.manage create-indexes
+    python -m app.manage build-search-index
+    python -m app.manage export-questions FILE [--database-url URL]
+    python -m app.manage import-questions FILE [--database-url URL] [--batch-size N]
+
+For export/import FILE may be "-" for stdout/stdin; without --database-url the
+app's database is used.
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
+
+from app.crud.crud_question import backfill_question_hashes
+from app.db.models import Base
+from app.db.session import SessionLocal, engine
+from app.services.question_search import ensure_search_index
+from app.services.question_transfer import IMPORT_BATCH_SIZE, import_lines, iter_export
+
+
+def backfill_hashes(args) -> None:
+    """Recompute every question's content hash (uuid hashes and text-only digests alike)."""
+    db = SessionLocal()
+    try:
+        updated = backfill_question_hashes(db, batch_size=args.batch_size)
+        print(f"Backfilled content hashes for {updated} questions")
+    finally:
+        db.close()
+
+
+def create_indexes(args) -> None:
+    """Create the indexes declared on the models that existing tables are missing."""
+    # create_all at startup only adds indexes along with the tables themselves
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if inspector.has_table(table.name):
+                for index in table.indexes:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+    print("Model indexes are in place")
+
+
+def build_search_index(args) -> None:
+    """Create the full-text search index (Postgres) or FTS table (SQLite) if missing."""
+    ensure_search_index(engine)
+    print("Question search index is in place")
+
+
+def _transfer_session(args):
+    if args.database_url:
+        return sessionmaker(bind=create_engine(args.database_url))()
+    return SessionLocal()
+
+
+def export_questions(args) -> None:
+    """Write the question bank as NDJSON, one question per line."""
+    db = _transfer_session(args)
+    try:
+        out = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8")
+        try:
+            out.writelines(iter_export(db))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    finally:
+        db.close()
+
+
+def import_questions(args) -> None:
+    """Load exported NDJSON questions, skipping ones already stored."""
+    db = _transfer_session(args)
+    try:
+        source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        try:
+            stats = import_lines(db, source, batch_size=args.batch_size)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(json.dumps(stats), file=sys.stderr)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill-hashes", help=backfill_hashes.__doc__)
+    backfill.add_argument("--batch-size", type=int, default=500)
+    backfill.set_defaults(run=backfill_hashes)
+    commands.add_parser("create-indexes", help=create_indexes.__doc__).set_defaults(run=create_indexes)
+    commands.add_parser("build-search-index", help=build_search_index.__doc__).set_defaults(run=build_search_index)
+    export = commands.add_parser("export-questions", help=export_questions.__doc__)
+    export.add_argument("file", help='NDJSON file, or "-" for stdout')
+    export.add_argument("--database-url", help="defaults to the app's database")
+    export.set_defaults(run=export_questions)
+    load = commands.add_parser("import-questions", help=import_questions.__doc__)
+    load.add_argument("file", help='NDJSON file, or "-" for stdin')
+    load.add_argument("--database-url", help="defaults to the app's database")
+    load.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    load.set_defaults(run=import_questions)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 from pydantic import BaseModel, Field
 from uuid import UUID
+from typing import Optional
 
 class PromptRequest(BaseModel):
     prompt: str
+    # Skip the generation cache and the question bank and always ask the LLM
+    fresh: bool = False
+    # Question bank filters; read from the prompt when not given
+    topic: Optional[str] = None
+    difficulty: Optional[str] = None
+    company: Optional[str] = None
 
 class PromptResponseRequest(BaseModel):
     prompt: str
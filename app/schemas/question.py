@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
 
@@ -26,3 +26,8 @@ class QuestionResponse(QuestionBase):
 
     class Config:
         from_attributes = True
+
+
+class QuestionBulkRequest(BaseModel):
+    # Order is kept in the response; ids that don't exist are left out
+    ids: list[UUID] = Field(..., min_length=1, max_length=10000)
@@ -0,0 +1,148 @@
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from app.utils.helpers import TTLCache
+
+_NUMBER = re.compile(r"\b\d+\b")
+_NON_WORD = re.compile(r"[^a-z0-9+#]+")
+
+# Fallback key shared by every topic of a profile
+ANY_TOPIC = "*"
+
+
+def topic_key(prompt: str) -> str:
+    """
+    Sizing key for a quiz prompt: its first line, normalized, without the
+    question count ("10 Python questions" and "25 python questions" share one).
+    Resume prompts carry the resume below the first line, so it's left out.
+    """
+    first_line = prompt.strip().splitlines()[0] if prompt.strip() else ""
+    text = _NUMBER.sub(" ", first_line.lower())
+    return " ".join(_NON_WORD.split(text)).strip()[:120] or ANY_TOPIC
+
+
+class BatchSizer:
+    """
+    Learns output tokens per question for each (profile, topic) and picks the
+    largest batch that should fit in `max_output_tokens` with some headroom.
+
+    Each finished call reports its output tokens and how many complete questions
+    it produced; the per-question cost is an exponentially weighted average, so
+    topics with long explanations settle on smaller batches and short ones on
+    larger. A truncated call counts every token against only the questions
+    that made it, which pushes the estimate (and the batch size) down.
+    Topics with fewer than `min_samples` calls fall back to the profile average.
+    Topic keys come from free-form prompts, so only the `max_topics` most
+    recently used are kept; every call refreshes its profile average, which
+    keeps that from being evicted while the profile is in use.
+
+    It also tracks the yield of each batch: the share of requested questions
+    that survive validation and dedup, so batches can ask for enough extra
+    up front that a refill call is rarely needed.
+    """
+
+    def __init__(
+        self,
+        max_output_tokens: int = 4096,
+        default_batch_size: int = 20,
+        min_batch_size: int = 5,
+        max_batch_size: int = 50,
+        headroom: float = 0.85,
+        alpha: float = 0.3,
+        min_samples: int = 2,
+        min_yield: float = 0.5,
+        max_topics: int = 1000,
+    ):
+        self.max_output_tokens = max_output_tokens
+        self.default_batch_size = default_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.headroom = headroom
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.min_yield = min_yield
+        # (profile, topic) -> learned values, LRU-bounded and never expiring
+        self._stats = TTLCache(maxsize=max_topics, ttl=0)
+        self._yields = TTLCache(maxsize=max_topics, ttl=0)
+        self._lock = threading.Lock()
+
+    def _update(self, key: Tuple[str, str], tokens_per_question: float, truncated: bool):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = {"tokens_per_question": tokens_per_question, "samples": 0, "truncated": 0}
+            self._stats.set(key, stats)
+        else:
+            stats["tokens_per_question"] += self.alpha * (tokens_per_question - stats["tokens_per_question"])
+        stats["samples"] += 1
+        stats["truncated"] += int(truncated)
+
+    def observe(self, profile: str, topic: str, output_tokens: int, questions: int, truncated: bool = False):
+        """Record one model call: output tokens spent and complete questions parsed from it."""
+        if output_tokens <= 0:
+            return
+        # A call that produced nothing still tells us one question costs more than it had room for
+        tokens_per_question = output_tokens / max(1, questions)
+        with self._lock:
+            self._update((profile, topic), tokens_per_question, truncated)
+            if topic != ANY_TOPIC:
+                self._update((profile, ANY_TOPIC), tokens_per_question, truncated)
+
+    def tokens_per_question(self, profile: str, topic: str = ANY_TOPIC) -> Optional[float]:
+        with self._lock:
+            for key in ((profile, topic), (profile, ANY_TOPIC)):
+                stats = self._stats.get(key)
+                if stats is not None and stats["samples"] >= self.min_samples:
+                    return stats["tokens_per_question"]
+        return None
+
+    def batch_size(self, profile: str, topic: str = ANY_TOPIC) -> int:
+        tokens_per_question = self.tokens_per_question(profile, topic)
+        if tokens_per_question is None:
+            return self.default_batch_size
+        size = int(self.max_output_tokens * self.headroom / tokens_per_question)
+        return max(self.min_batch_size, min(self.max_batch_size, size))
+
+    def _update_yield(self, key: Tuple[str, str], ratio: float):
+        stats = self._yields.get(key)
+        if stats is None:
+            self._yields.set(key, {"ratio": ratio, "samples": 1})
+        else:
+            stats["ratio"] += self.alpha * (ratio - stats["ratio"])
+            stats["samples"] += 1
+
+    def observe_yield(self, profile: str, topic: str, requested: int, kept: int):
+        """Record one finished batch: questions asked for and unique, valid questions kept."""
+        if requested <= 0:
+            return
+        ratio = min(1.0, kept / requested)
+        with self._lock:
+            self._update_yield((profile, topic), ratio)
+            if topic != ANY_TOPIC:
+                self._update_yield((profile, ANY_TOPIC), ratio)
+
+    def yield_ratio(self, profile: str, topic: str = ANY_TOPIC) -> float:
+        """Expected share of a batch that is kept; 1.0 until there is data, never below `min_yield`."""
+        with self._lock:
+            for key in ((profile, topic), (profile, ANY_TOPIC)):
+                stats = self._yields.get(key)
+                if stats is not None and stats["samples"] >= self.min_samples:
+                    return max(self.min_yield, stats["ratio"])
+        return 1.0
+
+    def snapshot(self) -> Dict:
+        """Learned values per profile and topic, for inspection."""
+        with self._lock:
+            stats = {key: dict(values) for key, values in sorted(self._stats.items())}
+        profiles: Dict[str, Dict] = {}
+        for (profile, topic), values in stats.items():
+            values["tokens_per_question"] = round(values["tokens_per_question"], 1)
+            values["batch_size"] = self.batch_size(profile, topic)
+            values["yield"] = round(self.yield_ratio(profile, topic), 3)
+            profiles.setdefault(profile, {})[topic] = values
+        return {
+            "max_output_tokens": self.max_output_tokens,
+            "default_batch_size": self.default_batch_size,
+            "headroom": self.headroom,
+            "profiles": profiles,
+        }
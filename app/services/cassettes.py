@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from typing import AsyncIterator, Dict, List, Optional
+
+import google.generativeai as genai
+from sqlalchemy.orm import Session
+from app.crud import crud_question
+from app.db.models import PromptLog, PromptResponse
+from app.services.batch_sizing import ANY_TOPIC, topic_key
+from app.services.json_stream import extract_json_objects
+from app.services.llm import FakeProvider, LLMProvider, LLMResponse, build_prompt, estimate_tokens
+
+
+def prompt_key(prompt: str, context: str) -> str:
+    return hashlib.sha256(build_prompt(prompt, context).encode("utf-8")).hexdigest()
+
+
+def _raw_question(question: Dict) -> Dict:
+    """A stored/validated question back in the shape the model emits."""
+    return {
+        "question": question["question_text"],
+        "options": {
+            "A": question["option_a"],
+            "B": question["option_b"],
+            "C": question["option_c"],
+            "D": question["option_d"],
+        },
+        "answer": question["correct_answer"],
+        "explanation": question.get("explanation", ""),
+        "topic": question.get("topic", "General"),
+        "difficulty": question.get("difficulty", "medium"),
+        "company": question.get("company", "General"),
+    }
+
+
+def _render(questions: List[Dict]) -> str:
+    return "```json\n" + json.dumps(questions, indent=2) + "\n```"
+
+
+_QUESTION_COLUMNS = (
+    "question_text", "option_a", "option_b", "option_c", "option_d",
+    "correct_answer", "explanation", "topic", "difficulty", "company",
+)
+
+
+def _entry(prompt: Optional[str], topic: str, text: str) -> Dict:
+    """A stored response filed under its topic; without the exact prompt it can't replay verbatim."""
+    return {
+        "key": None,
+        "topic": topic,
+        "text": text,
+        "finish_reason": "STOP",
+        "prompt_tokens": estimate_tokens(prompt or ""),
+        "output_tokens": estimate_tokens(text),
+        "latency": None,
+    }
+
+
+class Cassette:
+    """
+    Recorded raw model responses, one JSON object per line. Entries keep a hash
+    of the full prompt (for exact replay) and its topic key (for replaying
+    other prompts on the same topic), never the prompt text itself, since
+    resume prompts carry resume content.
+    """
+
+    def __init__(self, entries: Optional[List[Dict]] = None, path: Optional[str] = None):
+        self.entries: List[Dict] = []
+        self.path = path
+        self._by_key: Dict[str, Dict] = {}
+        self._questions: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        for entry in entries or ():
+            self._index(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _index(self, entry: Dict):
+        self.entries.append(entry)
+        if entry.get("key"):
+            self._by_key[entry["key"]] = entry
+        objects, _ = extract_json_objects(entry["text"])
+        questions = [item for item in objects if isinstance(item, dict) and "question" in item]
+        self._questions.setdefault(entry.get("topic") or ANY_TOPIC, []).extend(questions)
+        if entry.get("topic") not in (None, ANY_TOPIC):
+            self._questions.setdefault(ANY_TOPIC, []).extend(questions)
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        entries = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        return cls(entries, path=path)
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def add(self, prompt: str, context: str, response: LLMResponse) -> Dict:
+        """Record one response; with a path it's appended to the file right away."""
+        entry = {
+            "key": prompt_key(prompt, context),
+            "topic": topic_key(prompt),
+            "text": response.text,
+            "finish_reason": response.finish_reason,
+            "prompt_tokens": response.prompt_tokens,
+            "output_tokens": response.output_tokens,
+            "latency": round(response.latency, 3),
+        }
+        with self._lock:
+            self._index(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def exact(self, prompt: str, context: str) -> Optional[Dict]:
+        return self._by_key.get(prompt_key(prompt, context))
+
+    def questions(self, topic: str) -> List[Dict]:
+        """Recorded questions for a topic key, or for every topic when it has none."""
+        return self._questions.get(topic) or self._questions.get(ANY_TOPIC, [])
+
+    @classmethod
+    def from_prompt_responses(cls, db: Session, limit: int = 1000, path: Optional[str] = None) -> "Cassette":
+        """
+        Seed a cassette from stored generations: the latest prompt logs (their raw
+        model output when it was kept, else their questions), then legacy
+        PromptResponse rows, up to `limit` responses.
+        """
+        entries = []
+        logs = db.query(PromptLog).order_by(PromptLog.id.desc()).limit(limit).all()
+        wanted = [uuid.UUID(str(i)) for log in logs if not log.raw_response for i in log.question_ids or ()]
+        stored = {str(q.id): q for q in crud_question.get_questions_by_ids(db, wanted)}
+        for log in logs:
+            topic = topic_key(log.prompt or "")
+            if log.raw_response:
+                for text in json.loads(zlib.decompress(log.raw_response)):
+                    entries.append(_entry(log.prompt, topic, text))
+                continue
+            questions = [
+                _raw_question({column: getattr(stored[i], column) for column in _QUESTION_COLUMNS})
+                for i in map(str, log.question_ids or ()) if i in stored
+            ]
+            if questions:
+                entries.append(_entry(log.prompt, topic, _render(questions)))
+
+        rows = db.query(PromptResponse).order_by(PromptResponse.id.desc()).limit(max(0, limit - len(entries))).all()
+        for row in rows:
+            questions = [
+                _raw_question(q) for q in (row.response or [])
+                if isinstance(q, dict) and all(k in q for k in ("question_text", "option_a", "correct_answer"))
+            ]
+            if questions:
+                entries.append(_entry(row.prompt, topic_key(row.prompt or ""), _render(questions)))
+        return cls(entries[:limit], path=path)
+
+    @classmethod
+    def from_corpus(cls, directory: str) -> "Cassette":
+        """Every *.txt file in `directory` as one raw response with no topic."""
+        entries = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".txt"):
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    text = f.read()
+                entries.append({"key": None, "topic": ANY_TOPIC, "text": text, "finish_reason": "STOP"})
+        return cls(entries)
+
+
+class InjectedFailure(Exception):
+    """A replayed API error; `code` is read like a google.api_core status code."""
+
+    def __init__(self, code: int):
+        super().__init__(f"Injected failure ({code})")
+        self.code = code
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Serves a cassette instead of calling the model. A prompt recorded verbatim
+    gets its recorded response; any other prompt gets the requested number of
+    recorded questions for its topic (any topic as a last resort), rotating
+    through them so successive batches differ. Prompts the cassette can't
+    answer go to `fallback` (e.g. a FakeProvider) or raise LookupError.
+
+    Each call waits `latency` ± `jitter` seconds, and fails with probability
+    `failure_rate` with one of `failure_codes`, so retries, breakers and
+    refills can be exercised offline.
+    """
+    name = "replay"
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_codes=(429, 503),
+        fallback: Optional[LLMProvider] = None,
+        chunk_size: int = 64,
+        seed: int = 0,
+        model_name: str = "replay",
+    ):
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_codes = tuple(failure_codes)
+        self.fallback = fallback
+        self.chunk_size = chunk_size
+        self.model_name = model_name
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._cursors: Dict[str, int] = {}
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise InjectedFailure(self._random.choice(self.failure_codes))
+
+    def _replay(self, prompt: str, context: str) -> Optional[LLMResponse]:
+        entry = self.cassette.exact(prompt, context)
+        if entry is not None:
+            text, finish_reason = entry["text"], entry.get("finish_reason", "STOP")
+        else:
+            topic = topic_key(prompt)
+            pool = self.cassette.questions(topic)
+            if not pool:
+                return None
+            count = min(FakeProvider._requested_count(prompt), len(pool))
+            start = self._cursors.get(topic, 0)
+            self._cursors[topic] = (start + count) % len(pool)
+            text, finish_reason = _render([pool[(start + i) % len(pool)] for i in range(count)]), "STOP"
+        return LLMResponse(
+            text=text,
+            model=self.model_name,
+            finish_reason=finish_reason,
+            prompt_tokens=estimate_tokens(build_prompt(prompt, context)),
+            output_tokens=estimate_tokens(text),
+        )
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        self.calls += 1
+        started = time.perf_counter()
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self._maybe_fail()
+
+        response = self._replay(prompt, context)
+        if response is None:
+            if self.fallback is None:
+                raise LookupError(f"Nothing recorded for topic {topic_key(prompt)!r}")
+            response = await self.fallback.generate(prompt, context, generation_config)
+        response.latency = time.perf_counter() - started
+        return response
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        self.calls += 1
+        self._maybe_fail()
+        response = self._replay(prompt, context)
+        if response is None:
+            if self.fallback is None:
+                raise LookupError(f"Nothing recorded for topic {topic_key(prompt)!r}")
+            response = await self.fallback.generate(prompt, context, generation_config)
+
+        text = response.text
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        # Spread the call's latency over the chunks like a token stream
+        delay = self._delay() / len(chunks) if chunks else 0
+        for chunk in chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class RecordingProvider(LLMProvider):
+    """Passes calls through to `provider` and records every completed response in `cassette`."""
+
+    def __init__(self, provider: LLMProvider, cassette: Cassette):
+        self.provider = provider
+        self.cassette = cassette
+        self.name = provider.name
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.provider, "model_name", self.name)
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        response = await self.provider.generate(prompt, context, generation_config)
+        self.cassette.add(prompt, context, response)
+        return response
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        chunks: List[str] = []
+        stream = self.provider.stream(prompt, context, generation_config)
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        # Only streams that ran to the end are worth replaying
+        text = "".join(chunks)
+        self.cassette.add(prompt, context, LLMResponse(
+            text=text,
+            model=self.model_name,
+            prompt_tokens=estimate_tokens(build_prompt(prompt, context)),
+            output_tokens=estimate_tokens(text),
+            latency=time.perf_counter() - started,
+        ))
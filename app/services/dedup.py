@@ -0,0 +1,189 @@
+import hashlib
+import random
+import re
+import threading
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Words that carry no meaning for "is this the same question?"
+STOPWORDS = frozenset("""
+a an the of to in on for with by at from as is are was were be been being it its this that these those
+which what whats when where who whom why how does do did can could would should will shall may might
+following best most correct statement statements given into about
+and or than then there their them they you your we our i
+""".split())
+
+# Words and symbols that flip or change a question's answer: "Which is NOT ...",
+# print(2 ** 3) vs print(3 ** 2). Two questions that differ in them never match.
+NEGATIONS = frozenset("""
+not no never none neither nor except cannot without unless false true incorrect untrue least most
+""".split())
+
+_NON_WORD = re.compile(r"[^a-z0-9+#]+")
+_NEGATED_VERB = re.compile(r"n['\u2019]t\b")
+_SIGNIFICANT = re.compile(
+    r"[a-z]+|\d+(?:\.\d+)?|\*\*|//|[=!<>]=|<<|>>|[+*%<>=&|^~]|(?<![a-z])[-/]|[-/](?![a-z])"
+)
+
+_MASK = (1 << 64) - 1
+
+
+def normalize_question_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_NON_WORD.split(text.lower())).strip()
+
+
+def _casefold(value) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def question_hash(question: dict) -> str:
+    """
+    Content digest stored in Question.hash: the question text, the four options
+    and the correct answer, each up to case and spacing only. Punctuation and
+    operators stay in ("a < b" vs "a > b", x[1:] vs x[:1]), and the same stem
+    with other options is another question.
+    """
+    parts = [_casefold(question[name]) for name in ("question_text", "option_a", "option_b", "option_c", "option_d")]
+    parts.append(str(question["correct_answer"]).strip().upper())
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def content_words(text: str) -> List[str]:
+    """Normalized words minus stopwords, with plural 's' stripped and "n't" spelled out."""
+    words = []
+    for word in normalize_question_text(_NEGATED_VERB.sub(" not", text.lower())).split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """
+    Content-word unigrams plus ordered adjacent pairs of a question;
+    rephrasings share most of them, swapped operands don't.
+    """
+    words = content_words(text)
+    grams = set(words)
+    grams.update(" ".join(pair) for pair in zip(words, words[1:]))
+    return frozenset(grams)
+
+
+def significant_tokens(text: str) -> Tuple[str, ...]:
+    """Negations, numbers and operators of a question, in order."""
+    lowered = _NEGATED_VERB.sub(" not", text.lower())
+    return tuple(
+        token for token in _SIGNIFICANT.findall(lowered)
+        if not token.isalpha() or token in NEGATIONS
+    )
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH index over normalized question text.
+
+    `text in index` is True for exact and near-duplicate (rephrased) questions,
+    and `add(text)` records one, so it can stand in for the plain set of
+    question texts used during generation. `find()` returns the key of the
+    matching entry. LSH only proposes candidates; a match needs the same
+    significant tokens (negations, numbers, operators, in order) and a true
+    shingle Jaccard of at least `threshold`, and unless the overlap reaches
+    `strong_threshold` one question's words must contain the other's, since a
+    swapped key term ("time" vs "space" complexity) is a new question.
+    Lookups hash ~20 shingles and probe `bands` buckets, well under a millisecond.
+
+    Matches are only good for dropping generated candidates: a near-duplicate
+    can still have a different answer, so it never stands in for a stored row.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        strong_threshold: float = 0.8,
+        num_perm: int = 32,
+        bands: int = 16,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.strong_threshold = strong_threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        # One random 64-bit mask per permutation (XOR-mask MinHash)
+        self._masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self._exact: Dict[tuple, object] = {}
+        self._buckets: List[Dict[tuple, List[int]]] = [{} for _ in range(bands)]
+        self._entries: List[tuple] = []  # (shingles, words, significant tokens, key)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def __contains__(self, text: str) -> bool:
+        return self.find(text) is not None
+
+    def _signature(self, grams: FrozenSet[str]) -> List[int]:
+        hashes = [hash(g) & _MASK for g in grams]
+        return [min(h ^ mask for h in hashes) for mask in self._masks]
+
+    def _band_keys(self, signature: List[int]):
+        rows = self.rows
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def find(self, text: str) -> Optional[object]:
+        """Key of an exact or near-duplicate entry, or None."""
+        significant = significant_tokens(text)
+        # Normalizing drops operators, so they're part of the exact key too
+        exact = (normalize_question_text(text), significant)
+        if exact in self._exact:
+            return self._exact[exact]
+        grams = shingles(text)
+        if not grams:
+            return None
+
+        seen = set()
+        for band, key in zip(self._buckets, self._band_keys(self._signature(grams))):
+            for entry_id in band.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry_grams, entry_words, entry_significant, entry_key = self._entries[entry_id]
+                if entry_significant == significant and self._is_duplicate(grams, entry_grams, entry_words):
+                    return entry_key
+        return None
+
+    def _is_duplicate(self, grams: FrozenSet[str], other_grams: FrozenSet[str], other_words: FrozenSet[str]) -> bool:
+        similarity = jaccard(grams, other_grams)
+        if similarity >= self.strong_threshold:
+            return True
+        if similarity < self.threshold:
+            return False
+        words = frozenset(g for g in grams if " " not in g)
+        return words <= other_words or other_words <= words
+
+    def add(self, text: str, key: Optional[object] = None) -> None:
+        significant = significant_tokens(text)
+        exact = (normalize_question_text(text), significant)
+        key = text if key is None else key
+        with self._lock:
+            if exact in self._exact:
+                return
+            self._exact[exact] = key
+            grams = shingles(text)
+            if not grams:
+                return
+            entry_id = len(self._entries)
+            self._entries.append((grams, frozenset(g for g in grams if " " not in g), significant, key))
+            for band, band_key in zip(self._buckets, self._band_keys(self._signature(grams))):
+                band.setdefault(band_key, []).append(entry_id)
+
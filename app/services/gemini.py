@@ -1,7 +1,8 @@
+from typing import AsyncIterator
+
 import google.generativeai as genai
-from app.core.config import settings
+from app.services.llm import LLMResponse, get_provider
 
-# Configure API key
 
 
 generation_config = genai.GenerationConfig(
@@ -141,24 +142,33 @@ Generate questions that reflect the sophistication and rigor expected at the hig
 """
 
 
-def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
+async def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY)  # dynamically set standard key
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        full_prompt = f"{context}\nUser Prompt: {prompt}"
-        response = model.generate_content(full_prompt, generation_config=generation_config)
+        response = await get_provider().generate(prompt, context, generation_config=generation_config)
         return response.text
     except Exception as e:
         return f"❌ Gemini Error: {str(e)}"
 
 
 # Function to get response using BULK Gemini API Key
-def get_bulk_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
+async def get_bulk_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
     try:
-        genai.configure(api_key=settings.BULK_GOOGLE_API_KEY)  # dynamically set bulk key
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        full_prompt = f"{context}\nUser Prompt: {prompt}"
-        response = model.generate_content(full_prompt, generation_config=generation_config)
+        response = await get_provider(bulk=True).generate(prompt, context, generation_config=generation_config)
         return response.text
     except Exception as e:
-        return f"❌ Gemini Bulk Error: {str(e)}"
\ No newline at end of file
+        return f"❌ Gemini Bulk Error: {str(e)}"
+
+
+async def generate_gemini_batch(prompt: str, context: str = DEFAULT_CONTEXT, bulk: bool = False) -> LLMResponse:
+    """Full response with token usage and finish reason. Errors propagate to the caller."""
+    return await get_provider(bulk=bulk).generate(prompt, context, generation_config=generation_config)
+
+
+async def stream_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT, bulk: bool = False) -> AsyncIterator[str]:
+    """Yield the raw response text chunk by chunk. Errors propagate to the caller."""
+    stream = get_provider(bulk=bulk).stream(prompt, context, generation_config=generation_config)
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
@@ -1,7 +1,6 @@
 import google.generativeai as genai
-from app.core.config import settings
+from app.services.llm import get_provider
 
-# Configure API key
 generation_config = genai.GenerationConfig(
     temperature=0.2,
     top_p=0.9,
@@ -72,23 +71,17 @@ Each question must be:
 
 
 
-def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
+async def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
     try:
-        genai.configure(api_key=settings.GOOGLE_API_KEY)  # dynamically set standard key
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        full_prompt = f"{context}\nUser Prompt: {prompt}"
-        response = model.generate_content(full_prompt, generation_config=generation_config)
+        response = await get_provider().generate(prompt, context, generation_config=generation_config)
         return response.text
     except Exception as e:
         return f"❌ Gemini Error: {str(e)}"
 
-# Function to get response using BULK Gemini API Key
-def get_bulk_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
+
+async def get_bulk_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
     try:
-        genai.configure(api_key=settings.BULK_GOOGLE_API_KEY)  # dynamically set bulk key
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        full_prompt = f"{context}\nUser Prompt: {prompt}"
-        response = model.generate_content(full_prompt, generation_config=generation_config)
+        response = await get_provider(bulk=True).generate(prompt, context, generation_config=generation_config)
         return response.text
     except Exception as e:
-        return f"❌ Gemini Bulk Error: {str(e)}"
\ No newline at end of file
+        return f"❌ Gemini Bulk Error: {str(e)}"
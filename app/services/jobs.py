@@ -0,0 +1,238 @@
+import asyncio
+import uuid
+from datetime import timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import GenerationJob, utcnow
+from app.db.session import SessionLocal
+from app.schemas.prompt import PromptRequest
+from app.services.quiz_assembly import generate_quiz, generate_resume_quiz
+
+# Set when a job is enqueued so an idle worker picks it up without waiting a poll
+_wakeup: Optional[asyncio.Event] = None
+_tasks: List[asyncio.Task] = []
+
+
+def enqueue_job(db: Session, user_id: uuid.UUID, kind: str, payload: dict, total: int) -> GenerationJob:
+    job = GenerationJob(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        kind=kind,
+        payload=payload,
+        status="queued",
+        total=total,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    if _wakeup is not None:
+        _wakeup.set()
+    return job
+
+
+def get_job(db: Session, job_id: uuid.UUID, user_id: uuid.UUID) -> Optional[GenerationJob]:
+    return db.query(GenerationJob).filter(GenerationJob.id == job_id, GenerationJob.user_id == user_id).first()
+
+
+def claim_next_job(db: Session) -> Optional[GenerationJob]:
+    """
+    Move the oldest queued job to running. Rows locked by another worker
+    (or another app instance) are skipped rather than waited on.
+    """
+    job = (
+        db.query(GenerationJob)
+        .filter(GenerationJob.status == "queued")
+        .order_by(GenerationJob.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.rollback()
+        return None
+    now = utcnow()
+    job.status = "running"
+    job.attempts += 1
+    job.started_at = now
+    job.heartbeat_at = now
+    db.commit()
+    return job
+
+
+def recover_stale_jobs(db: Session) -> int:
+    """
+    Requeue running jobs whose worker stopped sending heartbeats (process crash,
+    redeploy); jobs that already used up their attempts are failed instead.
+    """
+    cutoff = utcnow() - timedelta(seconds=settings.GENERATION_JOB_STALE_SECONDS)
+    stale = (
+        db.query(GenerationJob)
+        .filter(GenerationJob.status == "running", GenerationJob.heartbeat_at < cutoff)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in stale:
+        if job.attempts >= settings.GENERATION_JOB_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = "Worker stopped responding"
+            job.finished_at = utcnow()
+        else:
+            job.status = "queued"
+    db.commit()
+    if stale:
+        print(f"Recovered {len(stale)} stale generation job(s)")
+    return len(stale)
+
+
+async def _run_general(db: Session, job: GenerationJob, on_progress) -> dict:
+    return await generate_quiz(db, PromptRequest(**job.payload), job.user_id, on_progress)
+
+
+async def _run_resume(db: Session, job: GenerationJob, on_progress) -> dict:
+    return await generate_resume_quiz(
+        db, uuid.UUID(job.payload["resume_id"]), job.payload["user_prompt"], job.user_id, on_progress
+    )
+
+
+_HANDLERS = {
+    "general": _run_general,
+    "resume": _run_resume,
+}
+
+
+async def _heartbeat(db: Session, job: GenerationJob, progress: dict, changed: asyncio.Event):
+    """
+    The only writer of `job` while it runs: commits reported progress as it
+    comes in, and a heartbeat at least every third of the stale timeout.
+    Commits go through the threadpool so they never block the event loop.
+    """
+    interval = max(1, settings.GENERATION_JOB_STALE_SECONDS // 3)
+    while True:
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        changed.clear()
+        for name, value in progress.items():
+            setattr(job, name, value)
+        job.heartbeat_at = utcnow()
+        await run_in_threadpool(db.commit)
+
+
+def _set_status(db: Session, job_id: uuid.UUID, **values) -> None:
+    db.rollback()
+    job = db.get(GenerationJob, job_id)
+    for name, value in values.items():
+        setattr(job, name, value)
+    db.commit()
+
+
+async def run_job(job_id: uuid.UUID):
+    # Job bookkeeping gets its own session so progress commits never
+    # interleave with the generation's own transactions
+    status_db = SessionLocal()
+    work_db = SessionLocal()
+    try:
+        job = await run_in_threadpool(status_db.get, GenerationJob, job_id)
+        progress = {}
+        changed = asyncio.Event()
+
+        def on_progress(done: int, total: int):
+            progress.update(progress=done, total=total)
+            changed.set()
+
+        heartbeat = asyncio.ensure_future(_heartbeat(status_db, job, progress, changed))
+        try:
+            result = await _HANDLERS[job.kind](work_db, job, on_progress)
+        finally:
+            heartbeat.cancel()
+            # Let an in-flight commit finish before status_db is used again
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+        await run_in_threadpool(
+            _set_status, status_db, job_id,
+            status="succeeded", result=result, progress=len(result.get("ids", [])), finished_at=utcnow()
+        )
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back instead of waiting for it to go stale
+        await run_in_threadpool(_set_status, status_db, job_id, status="queued")
+        raise
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"Generation job {job_id} failed: {detail}")
+        await run_in_threadpool(
+            _set_status, status_db, job_id, status="failed", error=str(detail), finished_at=utcnow()
+        )
+    finally:
+        await run_in_threadpool(work_db.close)
+        await run_in_threadpool(status_db.close)
+
+
+def _claim_next_job_id() -> Optional[uuid.UUID]:
+    db = SessionLocal()
+    try:
+        job = claim_next_job(db)
+        return job.id if job is not None else None
+    finally:
+        db.close()
+
+
+def _recover_stale_jobs() -> None:
+    db = SessionLocal()
+    try:
+        recover_stale_jobs(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Stale job recovery failed: {str(e)}")
+    finally:
+        db.close()
+
+
+async def _worker(number: int):
+    while True:
+        try:
+            _wakeup.clear()
+            job_id = await run_in_threadpool(_claim_next_job_id)
+
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=settings.GENERATION_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            print(f"Worker {number} running generation job {job_id}")
+            await run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Generation worker {number} error: {str(e)}")
+            await asyncio.sleep(settings.GENERATION_JOB_POLL_SECONDS)
+
+
+async def _reaper():
+    interval = max(1, settings.GENERATION_JOB_STALE_SECONDS // 2)
+    while True:
+        await run_in_threadpool(_recover_stale_jobs)
+        await asyncio.sleep(interval)
+
+
+def start_workers(workers: int = settings.GENERATION_WORKERS):
+    """Start the bounded generation worker pool on the running event loop."""
+    global _wakeup
+    if _tasks:
+        return
+    _wakeup = asyncio.Event()
+    _tasks.append(asyncio.ensure_future(_reaper()))
+    for number in range(1, max(1, workers) + 1):
+        _tasks.append(asyncio.ensure_future(_worker(number)))
+
+
+async def stop_workers():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,195 @@
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+# Characters that change parser state outside / inside a JSON string
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_GAP = frozenset(" \t\r\n,")
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class JSONStreamError(ValueError):
+    """The model output stopped looking like a JSON array of objects."""
+
+
+def loads_object(text: str) -> Any:
+    """json.loads that tolerates raw control characters and trailing commas."""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+
+
+class IncrementalArrayParser:
+    """
+    Incrementally parses a JSON array of objects fed in arbitrary text chunks
+    (e.g. an LLM token stream, optionally wrapped in a markdown fence).
+
+    `feed()` returns every top-level object whose closing brace has arrived,
+    so callers can act on each item before the array is complete. Strings and
+    escapes are tracked, so braces inside question text don't confuse it, and
+    each character is scanned once.
+
+    Raises JSONStreamError as soon as the output goes off the rails: no array
+    within `max_preamble` characters, or a bare value where an object belongs.
+    With lenient=True stray values and text between items are skipped instead.
+    """
+
+    def __init__(self, max_preamble: int = 2000, lenient: bool = False):
+        self.max_preamble = max_preamble
+        self.lenient = lenient
+        self.started = False
+        self.done = False
+        self.skipped = 0  # objects that closed but didn't parse
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0  # nesting depth inside the array (array itself excluded)
+        self._in_string = False
+        self._obj_start = None
+
+    @property
+    def pending(self) -> str:
+        """Text of the object currently being received, if any."""
+        return self._buf[self._obj_start:] if self._obj_start is not None else ""
+
+    def feed(self, chunk: str) -> List[Dict]:
+        if self.done or not chunk:
+            return []
+        self._buf += chunk
+        objects: List[Dict] = []
+
+        if not self.started:
+            start = self._buf.find("[")
+            if start == -1:
+                if not self.lenient and len(self._buf) > self.max_preamble:
+                    raise JSONStreamError("No JSON array found in model output")
+                return objects
+            self.started = True
+            self._pos = start + 1
+
+        buf = self._buf
+        pos = self._pos
+        length = len(buf)
+        while pos < length:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = length
+                    break
+                if match.group() == "\\":
+                    if match.end() >= length:
+                        # Escape split across chunks; resume at the backslash
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(buf, pos)
+            if match is None:
+                if self._depth == 0:
+                    self._check_gap(buf[pos:])
+                pos = length
+                break
+
+            ch = match.group()
+            if self._depth == 0:
+                self._check_gap(buf[pos:match.start()])
+            pos = match.end()
+
+            if ch == '"':
+                if self._depth == 0 and not self.lenient:
+                    raise JSONStreamError("Expected an object but found a string in the array")
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    if ch == "[" and not self.lenient:
+                        raise JSONStreamError("Expected an object but found a nested array")
+                    if ch == "{":
+                        self._obj_start = match.start()
+                self._depth += 1
+            elif self._depth == 0:
+                if ch == "]":
+                    self.done = True
+                    break
+                if not self.lenient:
+                    raise JSONStreamError("Unbalanced closing brace in model output")
+            else:
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start is None:
+                    # A stray nested array skipped in lenient mode
+                    continue
+                if self._depth == 0:
+                    try:
+                        item = loads_object(buf[self._obj_start:pos])
+                    except json.JSONDecodeError:
+                        item = None
+                    if isinstance(item, dict):
+                        objects.append(item)
+                    else:
+                        self.skipped += 1
+                    self._obj_start = None
+
+        # Drop everything that can no longer be part of a pending object
+        keep_from = self._obj_start if self._obj_start is not None else pos
+        self._buf = buf[keep_from:]
+        if self._obj_start is not None:
+            self._obj_start = 0
+        self._pos = pos - keep_from
+        return objects
+
+    def _check_gap(self, text: str):
+        # Between top-level items only whitespace and commas are expected
+        if not self.lenient and text.strip(" \t\r\n,"):
+            raise JSONStreamError(f"Unexpected text between array items: {text.strip()[:40]!r}")
+
+
+def extract_json_objects(raw: str) -> Tuple[List[Dict], bool]:
+    """
+    Single pass over a raw model response: returns every complete object of the
+    first JSON array that has any (markdown fences and chatter around it are
+    ignored, including bracketed asides like "[as requested]") and whether
+    that array was closed. When the model hit max_output_tokens mid-object the
+    complete objects before the cut are still returned.
+    """
+    first = None
+    start = raw.find("[")
+    while start != -1:
+        objects, closed = _array_objects(raw, start)
+        if objects:
+            return objects, closed
+        first = first or (objects, closed)
+        start = raw.find("[", start + 1)
+    return first or ([], False)
+
+
+def _array_objects(raw: str, start: int) -> Tuple[List[Dict], bool]:
+    """Complete objects of the array opening at raw[start], and whether it was closed."""
+    # Fast path: well-formed objects are decoded in C straight off the buffer.
+    # The first one that isn't (trailing comma, truncation, stray text) hands
+    # the rest of the text to the string-aware scanner.
+    objects: List[Dict] = []
+    pos = start + 1
+    length = len(raw)
+    while True:
+        while pos < length and raw[pos] in _GAP:
+            pos += 1
+        if pos >= length:
+            return objects, False
+        if raw[pos] == "]":
+            return objects, True
+        if raw[pos] != "{":
+            break
+        try:
+            item, pos = _DECODER.raw_decode(raw, pos)
+        except json.JSONDecodeError:
+            break
+        objects.append(item)
+
+    parser = IncrementalArrayParser(lenient=True)
+    objects.extend(parser.feed("[" + raw[pos:]))
+    return objects, parser.done
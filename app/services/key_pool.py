@@ -0,0 +1,305 @@
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import google.generativeai as genai
+from app.services.llm import LLMProvider, LLMResponse, build_prompt, estimate_tokens
+from app.services.metrics import metrics
+
+# HTTP status codes worth retrying on another attempt (rate limit, server side)
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+# The key itself is unusable; take it out of rotation straight away
+KEY_REJECTED_STATUS = frozenset({401, 403})
+
+
+class KeyPoolExhausted(RuntimeError):
+    """Every key in the pool is out of rotation."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    # google.api_core errors carry the HTTP status as `code`
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def is_key_failure(error: Exception) -> bool:
+    """
+    Transport, timeout, 429/5xx and 401/403 errors say the key or its endpoint
+    is in trouble. Anything else (a safety-blocked response, unparseable
+    output) is about one response's content and says nothing about the key.
+    """
+    return is_retryable(error) or _status_code(error) in KEY_REJECTED_STATUS
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and keeps the key out
+    of rotation for `reset_timeout` seconds; the next call after that is a
+    trial that closes the breaker on success or reopens it on failure. While
+    the trial is in flight no other call is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open":
+            return not self.trial
+        return state == "closed"
+
+    def begin_call(self):
+        """A call is going out on the key; in half_open it is the trial."""
+        if self.state == "half_open":
+            self.trial = True
+
+    def end_call(self):
+        # Also reached when the call is cancelled, so a trial never stays claimed
+        self.trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self, trip: bool = False):
+        self.trial = False
+        self.failures += 1
+        if trip or self.failures >= self.failure_threshold or self.state == "half_open":
+            self.opened_at = time.monotonic()
+
+
+class PooledKey:
+    def __init__(self, name: str, provider: LLMProvider, rpm: int, tpm: int, breaker: CircuitBreaker):
+        self.name = name
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.breaker = breaker
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+
+    def wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class KeyPool(LLMProvider):
+    """
+    Spreads calls over one provider per API key. Each key has token buckets for
+    its requests-per-minute and tokens-per-minute quota, so calls go to a key
+    with quota to spare (waiting only when every key is saturated) and the pool
+    sustains the combined quota. A key that keeps failing is taken out of
+    rotation by its circuit breaker; 429/5xx errors are retried with jittered
+    exponential backoff, normally on a different key. Only key failures
+    (transport, timeout, 429/5xx, 401/403) count toward a breaker; content
+    errors are passed straight to the caller.
+    """
+    name = "pool"
+
+    def __init__(
+        self,
+        keys: List[PooledKey],
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        default_output_tokens: int = 2048,
+    ):
+        if not keys:
+            raise ValueError("KeyPool needs at least one key")
+        self.keys = keys
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.default_output_tokens = default_output_tokens
+        self._next = 0
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.keys[0].provider, "model_name", self.name)
+
+    def _reserve_tokens(self, prompt: str, context: str, generation_config) -> int:
+        # Quota is charged up front for the prompt plus the largest possible
+        # answer; the unused part is refunded once the real usage is known.
+        output = getattr(generation_config, "max_output_tokens", None) or self.default_output_tokens
+        return estimate_tokens(build_prompt(prompt, context)) + output
+
+    async def _acquire(self, reserved: int, exclude: Optional[PooledKey] = None) -> PooledKey:
+        while True:
+            available = [key for key in self.keys if key.breaker.allow()]
+            if not available:
+                raise KeyPoolExhausted("All API keys are temporarily out of rotation")
+            # Prefer a different key than the one that just failed, when there is one
+            if exclude is not None and len(available) > 1:
+                available = [key for key in available if key is not exclude]
+
+            # Round-robin start so equally idle keys share the load
+            start = self._next % len(available)
+            ordered = available[start:] + available[:start]
+            key = min(ordered, key=lambda k: (k.wait_time(reserved), k.in_flight))
+            wait = key.wait_time(reserved)
+            if wait <= 0:
+                self._next += 1
+                key.requests.take(1)
+                key.tokens.take(reserved)
+                key.breaker.begin_call()
+                return key
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spread retries of concurrent callers instead of bunching them
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _record_failure(self, key: PooledKey, error: Exception):
+        if not is_key_failure(error):
+            # The call went through, so the key works; only its content was bad
+            key.breaker.record_success()
+            return
+        key.failures += 1
+        status = _status_code(error)
+        was_open = key.breaker.state == "open"
+        key.breaker.record_failure(trip=status in KEY_REJECTED_STATUS)
+        metrics.inc("llm_key_failures_total", key=key.name, status=status or type(error).__name__)
+        if not was_open and key.breaker.state == "open":
+            metrics.inc("llm_breaker_opened_total", key=key.name)
+        print(f"Gemini key {key.name} failed ({status or type(error).__name__}): {str(error)[:200]}")
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        return attempt < self.max_retries and is_key_failure(error)
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        reserved = self._reserve_tokens(prompt, context, generation_config)
+        failed_key = None
+        attempt = 0
+        while True:
+            key = await self._acquire(reserved, exclude=failed_key)
+            key.in_flight += 1
+            key.calls += 1
+            try:
+                response = await key.provider.generate(prompt, context, generation_config)
+            except Exception as e:
+                key.tokens.refund(reserved)
+                self._record_failure(key, e)
+                if not self._should_retry(e, attempt):
+                    raise
+                failed_key = key
+                metrics.inc("llm_retries_total", key=key.name)
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            finally:
+                key.in_flight -= 1
+                key.breaker.end_call()
+
+            key.breaker.record_success()
+            key.tokens.refund(max(0, reserved - response.prompt_tokens - response.output_tokens))
+            return response
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        # Only a failure before the first chunk can be retried transparently
+        reserved = self._reserve_tokens(prompt, context, generation_config)
+        failed_key = None
+        attempt = 0
+        while True:
+            key = await self._acquire(reserved, exclude=failed_key)
+            key.in_flight += 1
+            key.calls += 1
+            received = 0
+            stream = key.provider.stream(prompt, context, generation_config)
+            try:
+                async for chunk in stream:
+                    received += len(chunk)
+                    yield chunk
+            except Exception as e:
+                self._record_failure(key, e)
+                if received or not self._should_retry(e, attempt):
+                    raise
+                key.tokens.refund(reserved)
+                failed_key = key
+                metrics.inc("llm_retries_total", key=key.name)
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            finally:
+                key.in_flight -= 1
+                key.breaker.end_call()
+                await stream.aclose()
+
+            key.breaker.record_success()
+            key.tokens.refund(max(0, reserved - estimate_tokens(build_prompt(prompt, context)) - received // 4))
+            return
+
+    def snapshot(self) -> List[Dict]:
+        """Per-key quota, breaker state and counters, for inspection."""
+        return [
+            {
+                "key": key.name,
+                "breaker": key.breaker.state,
+                "in_flight": key.in_flight,
+                "calls": key.calls,
+                "failures": key.failures,
+                "requests_available": int(key.requests.tokens),
+                "tokens_available": int(key.tokens.tokens),
+            }
+            for key in self.keys
+        ]
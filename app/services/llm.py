@@ -0,0 +1,421 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from app.core.config import settings
+from app.services.metrics import metrics
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    model: str
+    finish_reason: str = "STOP"
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "MAX_TOKENS"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for when the API doesn't report one."""
+    return max(1, len(text) // 4)
+
+
+def build_prompt(prompt: str, context: str) -> str:
+    return f"{context}\nUser Prompt: {prompt}"
+
+
+class LLMProvider:
+    """
+    A text generation backend. Providers are long-lived: create one per API key
+    and reuse it so model and transport objects survive between calls.
+    """
+    name = "base"
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        raise NotImplementedError
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yield the response text as it is produced. Closing the iterator early
+        (aclose) must stop generation so aborted outputs stop costing tokens.
+        """
+        response = await self.generate(prompt, context, generation_config)
+        yield response.text
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = settings.GEMINI_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        # One model per event loop: its gRPC async client binds to the loop
+        # it's first used on, and calls from any other loop fail
+        self._models = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _model(self) -> genai.GenerativeModel:
+        # genai.configure() sets one process-wide key, so each provider owns its
+        # own transport instead. GenerativeModel._async_client (and
+        # _prepare_request in stream()) are private to google-generativeai
+        # 0.3.0, pinned in requirements.txt; re-check both when upgrading it.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            model = self._models.get(loop)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name)
+                model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+                self._models[loop] = model
+        return model
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        model = self._model()
+        full_prompt = build_prompt(prompt, context)
+        started = time.perf_counter()
+        response = await model.generate_content_async(full_prompt, generation_config=generation_config)
+        latency = time.perf_counter() - started
+
+        text = response.text
+        candidate = response.candidates[0] if response.candidates else None
+        finish_reason = candidate.finish_reason.name if candidate is not None else "OTHER"
+        output_tokens = candidate.token_count if candidate is not None and candidate.token_count else estimate_tokens(text)
+        return LLMResponse(
+            text=text,
+            model=self.model_name,
+            finish_reason=finish_reason,
+            prompt_tokens=estimate_tokens(full_prompt),
+            output_tokens=output_tokens,
+            latency=latency,
+        )
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        model = self._model()
+        # Drive the raw gRPC call so it can be cancelled when the caller aborts;
+        # the SDK's streaming wrapper offers no way to do that.
+        request = model._prepare_request(
+            contents=build_prompt(prompt, context),
+            generation_config=generation_config,
+        )
+        call = await model._async_client.stream_generate_content(request)
+        try:
+            async for chunk in call:
+                if not chunk.candidates:
+                    continue
+                text = "".join(part.text for part in chunk.candidates[0].content.parts)
+                if text:
+                    yield text
+        finally:
+            call.cancel()
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline provider for load tests and local runs. The same
+    prompt always yields the same questions; the requested count is read from
+    the "EXACTLY N" phrasing the generator uses (or the first number in the prompt).
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, model_name: str = "fake-mcq", chunk_size: int = 64):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.model_name = model_name
+        self.calls = 0
+
+    @staticmethod
+    def _requested_count(prompt: str) -> int:
+        match = re.search(r"EXACTLY (\d+)", prompt) or re.search(r"\b(\d+)\b", prompt)
+        return int(match.group(1)) if match else 10
+
+    def render(self, prompt: str, context: str) -> str:
+        seed = hashlib.sha256(build_prompt(prompt, context).encode("utf-8")).hexdigest()[:12]
+        topic = prompt.strip().splitlines()[0][:60] if prompt.strip() else "General"
+        questions = []
+        for idx in range(self._requested_count(prompt)):
+            answer = "ABCD"[int(seed[idx % len(seed)], 16) % 4]
+            # Hash-derived terms keep questions lexically distinct, so the
+            # near-duplicate index treats them as different questions.
+            terms = hashlib.sha256(f"{seed}-{idx}".encode("utf-8")).hexdigest()
+            subject = " ".join(f"x{terms[i:i + 6]}" for i in range(0, 24, 6))
+            questions.append({
+                "question": f"In {topic}, what does {subject} evaluate to in scenario {idx + 1}?",
+                "options": {
+                    "A": f"Option A for scenario {idx + 1}",
+                    "B": f"Option B for scenario {idx + 1}",
+                    "C": f"Option C for scenario {idx + 1}",
+                    "D": f"Option D for scenario {idx + 1}",
+                },
+                "answer": answer,
+                "explanation": f"Option {answer} is correct for scenario {idx + 1}.",
+                "topic": topic,
+                "difficulty": "medium",
+                "company": "General",
+            })
+        return "```json\n" + json.dumps(questions, indent=2) + "\n```"
+
+    def _complete(self, prompt: str, context: str, generation_config) -> Tuple[str, str]:
+        text = self.render(prompt, context)
+        max_tokens = getattr(generation_config, "max_output_tokens", None)
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            # Mimic the real model hitting max_output_tokens mid-object
+            return text[: max_tokens * 4], "MAX_TOKENS"
+        return text, "STOP"
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        self.calls += 1
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        text, finish_reason = self._complete(prompt, context, generation_config)
+        return LLMResponse(
+            text=text,
+            model=self.model_name,
+            finish_reason=finish_reason,
+            prompt_tokens=estimate_tokens(build_prompt(prompt, context)),
+            output_tokens=estimate_tokens(text),
+            latency=time.perf_counter() - started,
+        )
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        self.calls += 1
+        text, _ = self._complete(prompt, context, generation_config)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        # Spread the configured latency over the chunks like a token stream
+        delay = self.latency / len(chunks) if chunks else 0
+        for chunk in chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+@dataclass
+class GenerationUsage:
+    """LLM calls made on behalf of one generation, summed (see track_usage)."""
+    calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    models: List[str] = field(default_factory=list)
+    # Raw response texts, only when asked for
+    raw: Optional[List[str]] = None
+
+    def record(self, model: str, prompt_tokens: int, output_tokens: int, text: str):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        if model not in self.models:
+            self.models.append(model)
+        if self.raw is not None:
+            self.raw.append(text)
+
+
+_usage: ContextVar[Optional[GenerationUsage]] = ContextVar("generation_usage", default=None)
+
+
+@contextmanager
+def track_usage(capture_raw: bool = False) -> Iterator[GenerationUsage]:
+    """
+    Sum every successful LLM call made in this context, including from tasks
+    started inside it (batches copy the context when they're created).
+    """
+    usage = GenerationUsage(raw=[] if capture_raw else None)
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+class InstrumentedProvider(LLMProvider):
+    """
+    Records latency, token counts, truncation and errors for every call made
+    through `provider`, labelled with the pool it serves (standard or bulk).
+    """
+
+    def __init__(self, provider: LLMProvider, pool: str):
+        self.provider = provider
+        self.pool = pool
+        self.name = provider.name
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.provider, "model_name", self.name)
+
+    def _record_error(self, mode: str, started: float, error: BaseException):
+        metrics.observe("llm_call_seconds", time.perf_counter() - started, pool=self.pool, mode=mode, outcome="error")
+        metrics.inc("llm_errors_total", pool=self.pool, error=type(error).__name__)
+
+    async def generate(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> LLMResponse:
+        started = time.perf_counter()
+        try:
+            response = await self.provider.generate(prompt, context, generation_config)
+        except Exception as e:
+            self._record_error("generate", started, e)
+            raise
+        metrics.observe("llm_call_seconds", time.perf_counter() - started, pool=self.pool, mode="generate", outcome="ok")
+        metrics.inc("llm_prompt_tokens_total", response.prompt_tokens, pool=self.pool)
+        metrics.inc("llm_output_tokens_total", response.output_tokens, pool=self.pool)
+        if response.truncated:
+            metrics.inc("llm_truncated_total", pool=self.pool)
+        usage = _usage.get()
+        if usage is not None:
+            usage.record(response.model or self.model_name, response.prompt_tokens, response.output_tokens, response.text)
+        return response
+
+    async def stream(
+        self,
+        prompt: str,
+        context: str,
+        generation_config: Optional[genai.GenerationConfig] = None,
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        first_chunk = None
+        received = 0
+        outcome = "ok"
+        usage = _usage.get()
+        chunks: Optional[List[str]] = [] if usage is not None and usage.raw is not None else None
+        stream = self.provider.stream(prompt, context, generation_config)
+        try:
+            async for chunk in stream:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                    metrics.observe("llm_first_chunk_seconds", first_chunk, pool=self.pool)
+                received += len(chunk)
+                if chunks is not None:
+                    chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The caller closed the stream early (enough questions, client gone)
+            outcome = "aborted"
+            raise
+        except Exception as e:
+            outcome = None
+            self._record_error("stream", started, e)
+            raise
+        finally:
+            await stream.aclose()
+            if outcome is not None:
+                metrics.observe("llm_call_seconds", time.perf_counter() - started, pool=self.pool, mode="stream", outcome=outcome)
+                # Streams don't report usage; estimate it from the text like the batch sizer does
+                prompt_tokens = estimate_tokens(build_prompt(prompt, context))
+                metrics.inc("llm_prompt_tokens_total", prompt_tokens, pool=self.pool)
+                metrics.inc("llm_output_tokens_total", received // 4, pool=self.pool)
+                if usage is not None:
+                    usage.record(self.model_name, prompt_tokens, received // 4, "".join(chunks or ()))
+
+
+_providers: Dict[str, LLMProvider] = {}
+
+
+_recording = None
+
+
+def _make_provider(api_key: str) -> LLMProvider:
+    global _recording
+    if settings.LLM_PROVIDER == "fake":
+        return FakeProvider(latency=settings.FAKE_LLM_LATENCY_MS / 1000)
+    if settings.LLM_PROVIDER == "replay":
+        from app.services.cassettes import Cassette, ReplayProvider
+
+        return ReplayProvider(
+            Cassette.load(settings.LLM_CASSETTE),
+            latency=settings.FAKE_LLM_LATENCY_MS / 1000,
+            fallback=FakeProvider(),
+        )
+    provider = GeminiProvider(api_key)
+    if settings.LLM_RECORD_CASSETTE:
+        # Capture live responses for offline replay; one cassette for every key
+        from app.services.cassettes import Cassette, RecordingProvider
+
+        if _recording is None:
+            _recording = Cassette.load(settings.LLM_RECORD_CASSETTE)
+        provider = RecordingProvider(provider, _recording)
+    return provider
+
+
+def _make_pool(api_keys) -> LLMProvider:
+    if settings.LLM_PROVIDER in ("fake", "replay"):
+        # Quotas belong to real keys; offline providers run unthrottled
+        return _make_provider("")
+    # Imported here: the pool module builds on the provider classes above
+    from app.services.key_pool import CircuitBreaker, KeyPool, PooledKey
+
+    keys = [
+        PooledKey(
+            name=f"...{api_key[-4:]}",
+            provider=_make_provider(api_key),
+            rpm=settings.GEMINI_KEY_RPM,
+            tpm=settings.GEMINI_KEY_TPM,
+            breaker=CircuitBreaker(settings.GEMINI_BREAKER_FAILURES, settings.GEMINI_BREAKER_RESET_SECONDS),
+        )
+        for api_key in api_keys
+    ]
+    return KeyPool(keys, max_retries=settings.GEMINI_MAX_RETRIES)
+
+
+def get_provider(bulk: bool = False) -> InstrumentedProvider:
+    """Return the shared, instrumented key pool for the standard or bulk API keys."""
+    name = "bulk" if bulk else "standard"
+    if name not in _providers:
+        _providers[name] = InstrumentedProvider(
+            _make_pool(settings.BULK_GOOGLE_API_KEYS if bulk else settings.GOOGLE_API_KEYS), name
+        )
+    return _providers[name]
+
+
+def set_provider(provider: LLMProvider, bulk: Optional[bool] = None):
+    """Swap in a provider (e.g. FakeProvider) for the standard key, the bulk key, or both."""
+    if bulk is None or not bulk:
+        _providers["standard"] = InstrumentedProvider(provider, "standard")
+    if bulk is None or bulk:
+        _providers["bulk"] = InstrumentedProvider(provider, "bulk")
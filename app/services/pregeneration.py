@@ -0,0 +1,183 @@
+import asyncio
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud import crud_question
+from app.db.models import GenerationJob, PregenerationSpend, PromptLog, QuizSession, utcnow
+from app.db.session import SessionLocal
+from app.services.batch_sizing import topic_key
+from app.services.gemini import DEFAULT_CONTEXT
+from app.services.key_pool import KeyPool
+from app.services.llm import get_provider
+from app.services.metrics import metrics
+from app.services.question_bank import resolve_bank_filters
+from app.services.quiz_generator import batch_sizer, generate_single_batch
+from app.services.single_flight import generation_flight
+
+# Session topics that aren't a subject the bank can be filled for
+_SKIP_TOPICS = frozenset({"", "resume", "general", "unknown"})
+
+# Lease held by whichever worker is pre-generating; one at a time across the
+# deployment, so the shared budget is checked and spent without races
+PREGEN_LOCK = "pregen"
+
+_task: Optional[asyncio.Task] = None
+
+
+def hot_topics(db: Session, limit: int = settings.PREGEN_HOT_TOPICS) -> List[Tuple[str, Optional[str]]]:
+    """
+    The most requested (topic, difficulty) pairs: quiz sessions created in the
+    last PREGEN_WINDOW_DAYS plus the latest stored prompts, resolved against
+    the bank's topic vocabulary. Topics are lowercased like the bank filters.
+    """
+    counts: Counter = Counter()
+    since = utcnow() - timedelta(days=settings.PREGEN_WINDOW_DAYS)
+    rows = (
+        db.query(func.lower(QuizSession.topic), func.lower(QuizSession.difficulty), func.count(QuizSession.id))
+        .filter(QuizSession.created_at >= since, QuizSession.topic.isnot(None))
+        .group_by(func.lower(QuizSession.topic), func.lower(QuizSession.difficulty))
+        .all()
+    )
+    for topic, difficulty, count in rows:
+        counts[(topic, difficulty)] += count
+
+    prompts = (
+        db.query(PromptLog.prompt)
+        .order_by(PromptLog.id.desc())
+        .limit(settings.PREGEN_PROMPT_SAMPLE)
+        .all()
+    )
+    for (prompt,) in prompts:
+        filters = resolve_bank_filters(db, prompt or "")
+        if filters is not None:
+            difficulty = filters["difficulty"].lower() if filters["difficulty"] else None
+            counts[(filters["topic"].lower(), difficulty)] += 1
+
+    return [key for key, _ in counts.most_common() if key[0].strip() not in _SKIP_TOPICS][:limit]
+
+
+def _budget_left(db: Session) -> int:
+    """Questions the deployment may still pre-generate this hour."""
+    since = utcnow() - timedelta(hours=1)
+    spent = (
+        db.query(func.coalesce(func.sum(PregenerationSpend.questions), 0))
+        .filter(PregenerationSpend.created_at >= since)
+        .scalar()
+    )
+    return settings.PREGEN_MAX_QUESTIONS_PER_HOUR - int(spent)
+
+
+def _record_spend(db: Session, questions: int) -> None:
+    # Rows past the hour no longer count; drop them while we're here
+    cutoff = utcnow() - timedelta(hours=1)
+    db.query(PregenerationSpend).filter(PregenerationSpend.created_at < cutoff).delete(synchronize_session=False)
+    db.add(PregenerationSpend(questions=questions))
+    db.commit()
+
+
+def _is_idle(db: Session) -> bool:
+    """No user generation waiting or running in this process, and no queued jobs anywhere."""
+    if generation_flight.active:
+        return False
+    provider = get_provider().provider
+    if isinstance(provider, KeyPool) and any(key.in_flight for key in provider.keys):
+        return False
+    return db.query(GenerationJob.id).filter(GenerationJob.status == "queued").first() is None
+
+
+def _pool_prompt(topic: str, difficulty: Optional[str], count: int) -> str:
+    level = f"{difficulty} " if difficulty else ""
+    return f"{count} {level}{topic} questions"
+
+
+def _plan_refill(db: Session) -> Optional[Tuple[str, Optional[str], int]]:
+    """(topic, difficulty, batch size) of the hot pool furthest below PREGEN_POOL_SIZE, or None."""
+    budget = _budget_left(db)
+    if budget <= 0:
+        return None
+
+    shortfalls = []
+    for topic, difficulty in hot_topics(db):
+        missing = settings.PREGEN_POOL_SIZE - crud_question.count_unused_questions(db, topic, difficulty)
+        if missing > 0:
+            shortfalls.append((missing, topic, difficulty))
+    if not shortfalls:
+        return None
+    missing, topic, difficulty = max(shortfalls)
+
+    probe = _pool_prompt(topic, difficulty, 0)
+    return topic, difficulty, min(missing, budget, batch_sizer.batch_size("general", topic_key(probe)))
+
+
+def _save_pool(db: Session, topic: str, difficulty: Optional[str], questions: List[dict]) -> Dict:
+    _record_spend(db, len(questions))
+    # File them under the pool's key so the bank filters find them
+    for question in questions:
+        question["topic"] = topic
+        if difficulty:
+            question["difficulty"] = difficulty
+    _, created, existing = crud_question.save_generated_questions(db, questions)
+    return {"topic": topic, "difficulty": difficulty, "created": len(created), "existing": len(existing)}
+
+
+async def refill_one(db: Session) -> Optional[Dict]:
+    """
+    Top up the hot (topic, difficulty) whose pool of unused questions is
+    furthest below PREGEN_POOL_SIZE with one bulk-key batch. Returns what was
+    done, or None when another worker is at it, every pool is full or the
+    deployment's hourly budget is spent. Database work runs in the threadpool.
+    """
+    backend = generation_flight.backend
+    if not await run_in_threadpool(backend.acquire, PREGEN_LOCK):
+        return None
+    try:
+        plan = await run_in_threadpool(_plan_refill, db)
+        if plan is None:
+            return None
+        topic, difficulty, count = plan
+        prompt = _pool_prompt(topic, difficulty, count)
+        questions = await generate_single_batch(
+            prompt, count, DEFAULT_CONTEXT, sizing_key=("general", topic_key(prompt)), bulk=True
+        )
+        return await run_in_threadpool(_save_pool, db, topic, difficulty, questions)
+    finally:
+        await run_in_threadpool(backend.release, PREGEN_LOCK)
+
+
+async def _scheduler():
+    while True:
+        await asyncio.sleep(settings.PREGEN_INTERVAL_SECONDS)
+        db = SessionLocal()
+        try:
+            if await run_in_threadpool(_is_idle, db):
+                result = await refill_one(db)
+                if result is not None:
+                    metrics.inc("pregen_batches_total", topic=result["topic"])
+                    metrics.inc("pregen_questions_created_total", result["created"], topic=result["topic"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            metrics.inc("pregen_failures_total", error=type(e).__name__)
+        finally:
+            await run_in_threadpool(db.close)
+
+
+def start_pregeneration():
+    """Start the hot-topic pool scheduler on the running event loop."""
+    global _task
+    if _task is None and settings.PREGEN_ENABLED:
+        _task = asyncio.ensure_future(_scheduler())
+
+
+async def stop_pregeneration():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,99 @@
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import PromptCacheEntry
+from app.utils.helpers import TTLCache
+
+_NUMBER = re.compile(r"\b(\d+)\b")
+_PUNCTUATION = re.compile(r"[^\w\s#+]")
+
+# normalized prompt key -> question ids in generation order
+_memory = TTLCache(maxsize=settings.PROMPT_CACHE_SIZE, ttl=settings.PROMPT_CACHE_TTL_SECONDS)
+
+
+def normalize_prompt(prompt: str, scope: str = "general") -> Tuple[str, Optional[int]]:
+    """
+    Reduce a prompt to a cache key plus the requested question count, so
+    "10 Python questions" and "  20 python  questions!" share one entry.
+    """
+    match = _NUMBER.search(prompt)
+    count = int(match.group(1)) if match else None
+    text = _NUMBER.sub("#", prompt.lower(), count=1)
+    text = _PUNCTUATION.sub(" ", text)
+    return f"{scope}:{' '.join(text.split())}", count
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get_cached_question_ids(db: Session, prompt: str, total_questions: int, scope: str = "general") -> Optional[List[str]]:
+    """
+    Question ids already generated for an equivalent prompt, or None.
+    Checks the in-process tier, then the DB tier (refilling the former).
+    """
+    key, _ = normalize_prompt(prompt, scope)
+    ids = _memory.get(key)
+    if ids is None:
+        entry = (
+            db.query(PromptCacheEntry)
+            .filter(
+                PromptCacheEntry.key_hash == _key_hash(key),
+                PromptCacheEntry.expires_at > datetime.now(timezone.utc),
+            )
+            .first()
+        )
+        if entry is None:
+            return None
+        ids = list(entry.question_ids)
+        _memory.set(key, ids)
+
+    if len(ids) < total_questions:
+        return None
+    return ids[:total_questions]
+
+
+def store_question_ids(db: Session, prompt: str, question_ids: List[str], scope: str = "general") -> None:
+    """Remember the ids generated for a prompt; a longer list replaces a shorter one."""
+    key, _ = normalize_prompt(prompt, scope)
+    cached = _memory.get(key)
+    if cached is None or len(question_ids) >= len(cached):
+        _memory.set(key, list(question_ids))
+
+    try:
+        key_hash = _key_hash(key)
+        now = datetime.now(timezone.utc)
+        live = (
+            db.query(PromptCacheEntry)
+            .filter(PromptCacheEntry.key_hash == key_hash, PromptCacheEntry.expires_at > now)
+            .first()
+        )
+        if live is not None and len(live.question_ids or []) > len(question_ids):
+            return
+
+        entry = live or db.get(PromptCacheEntry, key_hash)
+        expires_at = now + timedelta(seconds=settings.PROMPT_CACHE_DB_TTL_SECONDS)
+        if entry is None:
+            db.add(PromptCacheEntry(
+                key_hash=key_hash,
+                prompt_key=key,
+                question_ids=list(question_ids),
+                expires_at=expires_at,
+            ))
+        else:
+            entry.question_ids = list(question_ids)
+            entry.expires_at = expires_at
+        db.commit()
+    except Exception as e:
+        # The cache is an optimization; never fail a generation over it
+        db.rollback()
+        print(f"Failed to store prompt cache entry: {str(e)}")
+
+
+def invalidate(prompt: str, scope: str = "general") -> None:
+    key, _ = normalize_prompt(prompt, scope)
+    _memory.pop(key)
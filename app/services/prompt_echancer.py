@@ -1,11 +1,12 @@
-import google.generativeai as genai
 from app.core.config import settings
+from app.services.llm import get_provider
+from app.services.single_flight import SingleFlight
+from app.utils.helpers import TTLCache
 
-# Configure API key
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-
-# Load Gemini model
-model = genai.GenerativeModel('gemini-1.5-flash')
+# normalized prompt -> enhanced prompt
+_enhanced = TTLCache(maxsize=settings.PROMPT_ENHANCER_CACHE_SIZE, ttl=settings.PROMPT_ENHANCER_CACHE_TTL_SECONDS)
+# Enhancement is cheap to redo, so identical calls only coalesce within this process
+_flight = SingleFlight()
 
 DEFAULT_CONTEXT = """
 You are a prompt refinement assistant. Your task is to analyze and enhance user prompts for quiz question generation by:
@@ -24,10 +25,36 @@ You are a prompt refinement assistant. Your task is to analyze and enhance user
 Focus solely on enhancing the prompt for optimal quiz generation.
 """
 
-def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
+async def get_gemini_response(prompt: str, context: str = DEFAULT_CONTEXT) -> str:
     try:
-        full_prompt = f"{context}\nUser Prompt: {prompt}"
-        response = model.generate_content(full_prompt)
+        response = await get_provider().generate(prompt, context)
         return response.text
     except Exception as e:
         return f"❌ Gemini Error: {str(e)}"
+
+
+
+def normalize_input(prompt: str) -> str:
+    """Case and whitespace don't change the enhancement; numbers and wording do."""
+    return " ".join(prompt.lower().split())
+
+
+async def enhance_prompt(prompt: str) -> str:
+    """
+    Enhanced version of `prompt`, from the cache when an equivalent prompt was
+    enhanced recently. Concurrent identical calls share one LLM call, and errors
+    (returned as "❌ ..." strings like get_gemini_response) are never cached.
+    """
+    key = normalize_input(prompt)
+    enhanced = _enhanced.get(key)
+    if enhanced is not None:
+        return enhanced
+
+    async def run() -> str:
+        result = await get_gemini_response(prompt)
+        if not result.startswith("❌"):
+            _enhanced.set(key, result)
+        return result
+
+    enhanced, _ = await _flight.do(key, run)
+    return enhanced
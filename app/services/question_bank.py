@@ -0,0 +1,92 @@
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.crud import crud_question
+from app.db.models import Question
+from app.utils.helpers import TTLCache
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+
+# Placeholder companies the generator fills in; they don't narrow anything down
+_GENERIC_COMPANIES = frozenset({"", "general", "unknown", "none", "n/a"})
+
+# Distinct topics / companies in the bank, refreshed every few minutes
+_vocabulary = TTLCache(maxsize=2, ttl=300)
+
+
+def _phrase(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _bank_vocabulary(db: Session, column) -> Dict[str, str]:
+    """Normalized phrase -> lowercased stored value for every distinct value of `column`."""
+    vocabulary = _vocabulary.get(column.key)
+    if vocabulary is None:
+        vocabulary = {}
+        for (value,) in db.query(func.lower(column)).filter(column.isnot(None)).distinct():
+            phrase = _phrase(value)
+            if phrase and value not in _GENERIC_COMPANIES:
+                vocabulary.setdefault(phrase, value)
+        _vocabulary.set(column.key, vocabulary)
+    return vocabulary
+
+
+def _find_phrase(prompt_phrase: str, vocabulary: Dict[str, str]) -> Optional[str]:
+    # Longest match wins, so "machine learning" beats "learning"
+    padded = f" {prompt_phrase} "
+    best = None
+    for phrase, value in vocabulary.items():
+        if f" {phrase} " in padded and (best is None or len(phrase) > len(best[0])):
+            best = (phrase, value)
+    return best[1] if best else None
+
+
+def resolve_bank_filters(
+    db: Session,
+    prompt: str,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    company: Optional[str] = None,
+) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Topic / difficulty / company to pull bank questions for. Explicit values win;
+    the rest are read from the prompt ("10 hard python questions for google").
+    Returns None when no known topic can be found, since an unfiltered pick
+    would not match what the user asked for.
+    """
+    prompt_phrase = _phrase(prompt)
+    if not difficulty:
+        # The level's name as the generator stores it ("hard" -> "advanced")
+        difficulty = next(
+            (crud_question.DIFFICULTY_ALIASES[w][0] for w in prompt_phrase.split() if w in crud_question.DIFFICULTY_ALIASES),
+            None
+        )
+    if not topic:
+        topic = _find_phrase(prompt_phrase, _bank_vocabulary(db, Question.topic))
+    if not company:
+        company = _find_phrase(prompt_phrase, _bank_vocabulary(db, Question.company))
+    if not topic:
+        return None
+    return {"topic": topic, "difficulty": difficulty, "company": company}
+
+
+def pick_unseen_questions(
+    db: Session,
+    user_id: uuid.UUID,
+    prompt: str,
+    total_questions: int,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    company: Optional[str] = None,
+) -> List[Question]:
+    """
+    Up to `total_questions` bank questions for the prompt that this user hasn't
+    seen yet; the caller generates only the remainder.
+    """
+    filters = resolve_bank_filters(db, prompt, topic, difficulty, company)
+    if filters is None:
+        return []
+    return crud_question.get_unseen_questions(db, user_id, total_questions, **filters)
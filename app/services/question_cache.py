@@ -0,0 +1,118 @@
+import hashlib
+import json
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud import crud_question
+from app.db.models import Question
+from app.utils.helpers import TTLCache
+
+# question id -> serialized frontend payload; questions never change, so no expiry
+_memory = TTLCache(maxsize=settings.QUESTION_CACHE_SIZE, ttl=0)
+
+
+class RedisTier:
+    """Payloads shared by every worker, under "question:<id>"."""
+
+    def __init__(self, url: str, prefix: str = "question:"):
+        import redis  # optional dependency, only needed when a shared tier is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        values = self.client.mget([self.prefix + i for i in ids])
+        return {i: value.decode("utf-8") for i, value in zip(ids, values) if value is not None}
+
+    def set_many(self, payloads: Dict[str, str]) -> None:
+        self.client.mset({self.prefix + i: payload for i, payload in payloads.items()})
+
+
+def _make_shared() -> Optional[RedisTier]:
+    if settings.QUESTION_CACHE_REDIS_URL:
+        return RedisTier(settings.QUESTION_CACHE_REDIS_URL)
+    return None
+
+
+_shared = _make_shared()
+
+
+def serialize_question(question: Question) -> str:
+    """A stored question as the JSON object the quiz page renders."""
+    return json.dumps({
+        "id": str(question.id),
+        "question": question.question_text,
+        "options": [question.option_a, question.option_b, question.option_c, question.option_d],
+        "correctAnswer": question.correct_answer.upper(),
+        "explanation": question.explanation,
+    })
+
+
+def get_question_payloads(db: Session, question_ids: Iterable[uuid.UUID]) -> List[str]:
+    """
+    Serialized payloads for the given ids, in order, skipping ids that don't
+    exist. Checks this process, then the shared tier, then the database, and
+    fills the tiers above from whatever the one below returned.
+    """
+    ids = [str(i) for i in question_ids]
+    found: Dict[str, str] = {}
+    for i in ids:
+        payload = _memory.get(i)
+        if payload is not None:
+            found[i] = payload
+
+    missing = [i for i in dict.fromkeys(ids) if i not in found]
+    if missing and _shared is not None:
+        try:
+            shared = _shared.get_many(missing)
+        except Exception as e:
+            # The database still has everything; never fail a read over the cache
+            print(f"Shared question cache read failed: {str(e)}")
+            shared = {}
+        for i, payload in shared.items():
+            _memory.set(i, payload)
+        found.update(shared)
+        missing = [i for i in missing if i not in shared]
+
+    if missing:
+        loaded = {
+            str(q.id): serialize_question(q)
+            for q in crud_question.get_questions_by_ids(db, [uuid.UUID(i) for i in missing])
+        }
+        for i, payload in loaded.items():
+            _memory.set(i, payload)
+        if loaded and _shared is not None:
+            try:
+                _shared.set_many(loaded)
+            except Exception as e:
+                print(f"Shared question cache write failed: {str(e)}")
+        found.update(loaded)
+
+    return [found[i] for i in ids if i in found]
+
+
+def iter_question_payloads(
+    db: Session, question_ids: List[uuid.UUID], chunk_size: int = crud_question.FETCH_CHUNK_SIZE
+) -> Iterator[str]:
+    """Like get_question_payloads, a chunk at a time, so memory stays bounded for long lists."""
+    for start in range(0, len(question_ids), chunk_size):
+        yield from get_question_payloads(db, question_ids[start:start + chunk_size])
+
+
+def question_etag(question_ids: Iterable[uuid.UUID]) -> str:
+    """
+    Strong ETag for a list of question ids. Stored questions are immutable, so
+    the ids alone identify the response and a match needs no lookup at all.
+    """
+    digest = hashlib.sha256(",".join(str(i) for i in question_ids).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # "*" is not honoured: it would answer 304 before knowing the ids exist
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
@@ -0,0 +1,240 @@
+import base64
+import json
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, cast, func, literal_column, or_, text
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.orm import Session
+from app.crud import crud_question
+from app.db.models import Question
+
+SEARCH_CONFIG = "english"
+MAX_PAGE_SIZE = 100
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _filters(topic: Optional[str], difficulty: Optional[str], company: Optional[str]) -> Dict[str, str]:
+    # Case-insensitive like the bank filters, so ix_questions_bank_filters applies
+    values = {"topic": topic, "difficulty": difficulty, "company": company}
+    return {name: value.lower() for name, value in values.items() if value}
+
+
+def encode_cursor(score: float, question_id: str) -> str:
+    raw = json.dumps([score, question_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """(score, id) of the last result on the previous page; ValueError when malformed."""
+    try:
+        score, question_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), str(question_id)
+    except Exception:
+        raise ValueError("Invalid search cursor")
+
+
+class PostgresSearch:
+    """
+    A weighted tsvector over text (A), topic and company (B) and explanation (C),
+    held only in the GIN expression index ix_questions_search. Queries use the
+    same expression, take websearch syntax ("quoted phrases", -exclusions, or)
+    and rank with ts_rank_cd.
+    """
+
+    def __init__(self, config: str = SEARCH_CONFIG):
+        self.config = literal_column(f"'{config}'::regconfig")
+
+    def _vector(self, column, weight: str):
+        return func.setweight(
+            func.to_tsvector(self.config, func.coalesce(column, literal_column("''"))),
+            literal_column(f"'{weight}'"),
+        )
+
+    def document(self):
+        return (
+            self._vector(Question.question_text, "A")
+            .op("||")(self._vector(Question.topic, "B"))
+            .op("||")(self._vector(Question.company, "B"))
+            .op("||")(self._vector(Question.explanation, "C"))
+        )
+
+    def _valid(self, conn) -> Optional[bool]:
+        """Whether ix_questions_search is usable; None when it doesn't exist."""
+        return conn.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = 'ix_questions_search'"
+        )).scalar()
+
+    def exists(self, engine) -> bool:
+        with engine.connect() as conn:
+            return self._valid(conn) is True
+
+    def ensure(self, engine) -> None:
+        expression = self.document().compile(
+            dialect=engine.dialect, compile_kwargs={"literal_binds": True, "include_table": False}
+        )
+        # CONCURRENTLY can't run in a transaction, and keeps the table writable while it builds
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if self._valid(conn) is False:
+                # Left behind by an interrupted build; IF NOT EXISTS would keep it
+                conn.exec_driver_sql("DROP INDEX CONCURRENTLY ix_questions_search")
+            conn.exec_driver_sql(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_search ON questions USING gin (({expression}))"
+            )
+
+    def search(
+        self, db: Session, query: str, filters: Dict[str, str], limit: int, after: Optional[Tuple[float, str]]
+    ) -> List[Tuple[Question, float]]:
+        document = self.document()
+        tsquery = func.websearch_to_tsquery(self.config, query)
+        # float8 so a score read back from a cursor compares equal to itself
+        score = cast(func.ts_rank_cd(document, tsquery), DOUBLE_PRECISION)
+        statement = db.query(Question, score).filter(document.op("@@")(tsquery))
+        for name, value in filters.items():
+            statement = statement.filter(func.lower(getattr(Question, name)) == value)
+        if after is not None:
+            last_score, last_id = after
+            statement = statement.filter(or_(
+                score < last_score,
+                and_(score == last_score, Question.id > uuid.UUID(last_id)),
+            ))
+        return [(q, s) for q, s in statement.order_by(score.desc(), Question.id).limit(limit)]
+
+
+class SqliteSearch:
+    """
+    An FTS5 table, questions_fts, kept in step with questions by triggers, for
+    local runs and benchmarks on SQLite. Every query word must match (prefixes
+    allowed); results are ranked by bm25 with the same weighting as Postgres.
+    """
+
+    _OBJECTS = ("questions_fts", "questions_fts_insert", "questions_fts_delete")
+
+    def exists(self, engine) -> bool:
+        with engine.connect() as conn:
+            found = conn.execute(
+                text("SELECT count(*) FROM sqlite_master WHERE name IN (:table, :on_insert, :on_delete)"),
+                dict(zip(("table", "on_insert", "on_delete"), self._OBJECTS)),
+            ).scalar()
+        return found == len(self._OBJECTS)
+
+    def ensure(self, engine) -> None:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+                "question_id UNINDEXED, question_text, topic, company, explanation)"
+            ))
+            # Questions are never edited, so inserts and deletes are all there is to follow
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN "
+                "INSERT INTO questions_fts(question_id, question_text, topic, company, explanation) "
+                "VALUES (new.id, new.question_text, new.topic, new.company, new.explanation); END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN "
+                "DELETE FROM questions_fts WHERE question_id = old.id; END"
+            ))
+            conn.execute(text(
+                "INSERT INTO questions_fts(question_id, question_text, topic, company, explanation) "
+                "SELECT id, question_text, topic, company, explanation FROM questions "
+                "WHERE id NOT IN (SELECT question_id FROM questions_fts)"
+            ))
+
+    @staticmethod
+    def match_expression(query: str) -> Optional[str]:
+        """User input as an FTS5 query: every word quoted (no operator injection), as a prefix."""
+        words = _WORD.findall(query)
+        return " ".join(f'"{word}"*' for word in words) or None
+
+    def search(
+        self, db: Session, query: str, filters: Dict[str, str], limit: int, after: Optional[Tuple[float, str]]
+    ) -> List[Tuple[Question, float]]:
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        score = "-bm25(questions_fts, 4.0, 2.0, 2.0, 1.0)"
+        clauses = ["questions_fts MATCH :match"]
+        params = {"match": match, "limit": limit}
+        for name, value in filters.items():
+            clauses.append(f"lower(q.{name}) = :{name}")
+            params[name] = value
+        if after is not None:
+            clauses.append(f"({score} < :last_score OR ({score} = :last_score AND f.question_id > :last_id))")
+            params["last_score"], params["last_id"] = after
+        rows = db.execute(text(
+            f"SELECT f.question_id, {score} AS score FROM questions_fts f "
+            f"JOIN questions q ON q.id = f.question_id "
+            f"WHERE {' AND '.join(clauses)} ORDER BY score DESC, f.question_id LIMIT :limit"
+        ), params).all()
+        if not rows:
+            return []
+        questions = crud_question.get_questions_by_ids(db, [uuid.UUID(str(question_id)) for question_id, _ in rows])
+        by_id = {q.id: q for q in questions}
+        return [
+            (by_id[uuid.UUID(str(question_id))], score)
+            for question_id, score in rows if uuid.UUID(str(question_id)) in by_id
+        ]
+
+
+def get_backend(dialect_name: str):
+    return SqliteSearch() if dialect_name == "sqlite" else PostgresSearch()
+
+
+def ensure_search_index(engine) -> None:
+    """
+    Create the search index (Postgres) or FTS table (SQLite) if missing. It
+    reads the whole questions table, so it runs from `python -m app.manage
+    build-search-index`, not at startup.
+    """
+    get_backend(engine.dialect.name).ensure(engine)
+
+
+def search_index_exists(engine) -> bool:
+    """Cheap catalog check that ensure_search_index() has run."""
+    return get_backend(engine.dialect.name).exists(engine)
+
+
+def search_questions(
+    db: Session,
+    query: str,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    company: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Dict:
+    """
+    Bank questions matching `query`, best first, optionally narrowed by
+    (case-insensitive) topic, difficulty and company. Pages are keyset
+    paginated: pass the returned `next_cursor` to get the next one.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    backend = get_backend(db.get_bind().dialect.name)
+    hits = backend.search(db, query, _filters(topic, difficulty, company), limit + 1, after)
+
+    page = hits[:limit]
+    results = [
+        {
+            "id": str(q.id),
+            "question": q.question_text,
+            "options": [q.option_a, q.option_b, q.option_c, q.option_d],
+            "correctAnswer": q.correct_answer.upper(),
+            "explanation": q.explanation,
+            "topic": q.topic,
+            "difficulty": q.difficulty,
+            "company": q.company,
+            "score": round(score, 6),
+        }
+        for q, score in page
+    ]
+    next_cursor = None
+    if len(hits) > limit:
+        last, last_score = page[-1]
+        # SQLite keeps uuids as 32 hex digits, and its cursor compares in that form
+        last_id = last.id.hex if isinstance(backend, SqliteSearch) else str(last.id)
+        next_cursor = encode_cursor(last_score, last_id)
+    return {"results": results, "next_cursor": next_cursor}
@@ -0,0 +1,181 @@
+"""
+Move the question bank between databases as NDJSON, one question per line.
+The command line side is `python -m app.manage export-questions / import-questions`.
+"""
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.crud.crud_question import question_row
+from app.db.models import Question
+
+EXPORT_COLUMNS = (
+    "id", "question_text", "option_a", "option_b", "option_c", "option_d",
+    "correct_answer", "explanation", "topic", "difficulty", "company", "created_at",
+)
+# created_by points at users of the source database, so it isn't carried over
+IMPORT_COLUMNS = ("hash",) + EXPORT_COLUMNS
+IMPORT_BATCH_SIZE = 5000
+_REQUIRED = ("question_text", "option_a", "option_b", "option_c", "option_d", "correct_answer")
+
+
+def iter_export(db: Session, batch_size: int = 1000) -> Iterator[str]:
+    """Every question as an NDJSON line, read through a server-side cursor `batch_size` rows at a time."""
+    statement = select(*(getattr(Question, name) for name in EXPORT_COLUMNS))
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for row in result:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["id"] = str(record["id"])
+        if record["created_at"] is not None:
+            record["created_at"] = record["created_at"].isoformat()
+        yield json.dumps(record) + "\n"
+
+
+def parse_record(line: str) -> Optional[Dict]:
+    """A questions row from one exported line, or None when it isn't a valid question."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or not all(isinstance(record.get(name), str) for name in _REQUIRED):
+        return None
+    record["correct_answer"] = record["correct_answer"].upper().strip()
+    if record["correct_answer"] not in ("A", "B", "C", "D"):
+        return None
+
+    # The hash is always recomputed; the file's ids and timestamps are kept when valid
+    row = question_row({**record, "explanation": record.get("explanation") or ""})
+    try:
+        row["id"] = uuid.UUID(str(record["id"]))
+    except (KeyError, ValueError):
+        pass
+    try:
+        row["created_at"] = datetime.fromisoformat(record["created_at"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return {name: row[name] for name in IMPORT_COLUMNS}
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return r"\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+def _copy_rows(db: Session, rows: List[Dict]) -> int:
+    """COPY into a temp table, then one INSERT ... SELECT that skips stored hashes and ids."""
+    columns = ", ".join(IMPORT_COLUMNS)
+    conn = db.connection()
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS questions_import (LIKE questions INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[name]) for name in IMPORT_COLUMNS) + "\n")
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY questions_import ({columns}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+    result = conn.exec_driver_sql(
+        f"INSERT INTO questions ({columns}) SELECT {columns} FROM questions_import ON CONFLICT DO NOTHING"
+    )
+    return result.rowcount
+
+
+def _insert_rows(db: Session, rows: List[Dict], chunk_size: int = 500) -> int:
+    """Multi-row INSERTs that skip stored hashes and ids, chunked under SQLite's bind parameter limit."""
+    from sqlalchemy.dialects.sqlite import insert
+
+    created = 0
+    for start in range(0, len(rows), chunk_size):
+        statement = insert(Question).values(rows[start:start + chunk_size]).on_conflict_do_nothing()
+        created += db.execute(statement).rowcount
+    return created
+
+
+class QuestionImporter:
+    """
+    Feed it exported lines; every `batch_size` valid rows go in with one COPY
+    (Postgres) or multi-row INSERTs (SQLite) and a commit, so memory stays
+    flat for any file size. Rows whose content hash or id is already stored
+    are skipped, as are repeats within the file.
+    """
+
+    def __init__(self, db: Session, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.copy = db.get_bind().dialect.name == "postgresql"
+        self.stats = {"read": 0, "created": 0, "skipped": 0, "invalid": 0}
+        self._rows: Dict[str, Dict] = {}
+
+    def feed(self, line: str) -> None:
+        if not line.strip():
+            return
+        self.stats["read"] += 1
+        row = parse_record(line)
+        if row is None:
+            self.stats["invalid"] += 1
+            return
+        self._rows.setdefault(row["hash"], row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        rows = list(self._rows.values())
+        self._rows = {}
+        try:
+            created = _copy_rows(self.db, rows) if self.copy else _insert_rows(self.db, rows)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.stats["created"] += created
+
+    def feed_many(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.feed(line)
+
+    def finish(self) -> Dict[str, int]:
+        self.flush()
+        self.stats["skipped"] = self.stats["read"] - self.stats["invalid"] - self.stats["created"]
+        return self.stats
+
+
+def import_lines(db: Session, lines: Iterable[str], batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    importer = QuestionImporter(db, batch_size)
+    for line in lines:
+        importer.feed(line)
+    return importer.finish()
+
+
+async def import_stream(
+    db: Session, chunks: AsyncIterator[bytes], batch_size: int = IMPORT_BATCH_SIZE
+) -> Dict[str, int]:
+    """
+    import_lines over a byte stream (e.g. a request body) split into lines as
+    it arrives. Parsing and the batch writes run in the threadpool, off the
+    event loop.
+    """
+    importer = QuestionImporter(db, batch_size)
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if lines:
+            await run_in_threadpool(importer.feed_many, [line.decode("utf-8") for line in lines])
+    await run_in_threadpool(importer.feed, pending.decode("utf-8"))
+    return await run_in_threadpool(importer.finish)
+
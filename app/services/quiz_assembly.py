@@ -0,0 +1,385 @@
+import json
+import re
+import time
+import uuid
+import zlib
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.crud import crud_question, crud_quiz
+from app.core.config import settings
+from app.db.models import PromptLog, Question, resume, utcnow
+from app.schemas.prompt import PromptRequest
+from app.schemas.quiz_session import QuizSessionCreate
+from app.services.quiz_generator import QuizGenerationEngine, get_engine
+from app.services.prompt_cache import get_cached_question_ids, normalize_prompt, store_question_ids
+from app.services.llm import GenerationUsage, track_usage
+from app.services.metrics import metrics
+from app.services.question_bank import pick_unseen_questions
+from app.services.single_flight import generation_flight
+
+# Called with (questions ready, questions requested) as a quiz fills up
+ProgressCallback = Callable[[int, int], None]
+
+# monotonic time prompt logs were last purged in this process
+_last_purge = 0.0
+
+
+def requested_question_count(prompt: str) -> int:
+    # Extract exact number from prompt using regex
+    match = re.search(r'\b(\d+)\b', prompt)
+    total_questions = int(match.group(1)) if match else 30
+
+    # Enforce minimum/maximum bounds
+    return min(25, min(total_questions, 10000))
+
+
+def purge_prompt_logs(db: Session, retention_days: int = settings.PROMPT_LOG_RETENTION_DAYS) -> int:
+    """Delete prompt logs older than the retention window; returns how many went."""
+    cutoff = utcnow() - timedelta(days=retention_days)
+    deleted = db.query(PromptLog).filter(PromptLog.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def save_prompt_log(
+    db: Session,
+    prompt: str,
+    question_ids: List[str],
+    usage: Optional[GenerationUsage] = None,
+    seconds: Optional[float] = None,
+):
+    """
+    Log a generation: the prompt, the ids of its questions in order and the
+    LLM usage behind them. Logging never fails the quiz. Expired logs are
+    purged from here, at most once an hour per process.
+    """
+    global _last_purge
+    try:
+        raw = None
+        if usage is not None and usage.raw:
+            raw = zlib.compress(json.dumps(usage.raw).encode("utf-8"))
+        db.add(PromptLog(
+            prompt=prompt,
+            question_ids=list(question_ids),
+            model=",".join(usage.models)[:100] if usage is not None else None,
+            llm_calls=usage.calls if usage is not None else 0,
+            prompt_tokens=usage.prompt_tokens if usage is not None else 0,
+            output_tokens=usage.output_tokens if usage is not None else 0,
+            latency_ms=round(seconds * 1000) if seconds is not None else None,
+            raw_response=raw,
+        ))
+        db.commit()
+        if time.monotonic() - _last_purge > 3600:
+            _last_purge = time.monotonic()
+            purge_prompt_logs(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to save prompt log: {str(e)}")
+
+
+def bank_surplus(db: Session, questions: List[dict]) -> int:
+    """
+    Save questions generated past what the quiz needed so the bank can serve
+    them later. Returns how many were new; a failure here never fails the quiz.
+    """
+    if not questions:
+        return 0
+    try:
+        _, created, _ = crud_question.save_generated_questions(db, questions)
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to bank surplus questions: {str(e)}")
+        return 0
+    metrics.inc("surplus_banked_total", len(created))
+    return len(created)
+
+
+def _save_generation(
+    db: Session,
+    prompt: str,
+    questions: List[dict],
+    usage: GenerationUsage,
+    seconds: float,
+    surplus: List[dict],
+):
+    """Save a generation's questions, its prompt log and its surplus; returns save_generated_questions()."""
+    saved = crud_question.save_generated_questions(db, questions)
+    save_prompt_log(db, prompt, saved[0], usage, seconds)
+    bank_surplus(db, surplus)
+    return saved
+
+
+def question_dict(question: Question) -> dict:
+    """A stored question in the same shape the generator produces."""
+    return {
+        "question_text": question.question_text,
+        "option_a": question.option_a,
+        "option_b": question.option_b,
+        "option_c": question.option_c,
+        "option_d": question.option_d,
+        "correct_answer": question.correct_answer,
+        "explanation": question.explanation,
+        "topic": question.topic,
+        "difficulty": question.difficulty,
+        "company": question.company,
+    }
+
+
+def load_cached_quiz(
+    db: Session, prompt: str, total_questions: int, user_id: Optional[uuid.UUID] = None, scope: str = "general"
+):
+    """
+    (ids, question dicts) for an equivalent, already generated prompt with the
+    same `cache_scope`, in order; None on a miss, or when `user_id` already had
+    any of those questions.
+    """
+    cached_ids = get_cached_question_ids(db, prompt, total_questions, scope)
+    if cached_ids is None:
+        return None
+    if user_id is not None and crud_question.any_seen(db, user_id, [uuid.UUID(i) for i in cached_ids]):
+        return None
+
+    rows = {str(q.id): q for q in crud_question.get_questions_by_ids(db, [uuid.UUID(i) for i in cached_ids])}
+    if len(rows) != len(cached_ids):
+        return None
+    return cached_ids, [question_dict(rows[i]) for i in cached_ids]
+
+
+def pick_from_bank(db: Session, payload: PromptRequest, user_id: uuid.UUID, total_questions: int):
+    """Unseen bank questions for the prompt as (ids, question dicts); empty for fresh requests."""
+    if payload.fresh:
+        return [], []
+    rows = pick_unseen_questions(
+        db, user_id, payload.prompt, total_questions,
+        topic=payload.topic, difficulty=payload.difficulty, company=payload.company
+    )
+    return [str(q.id) for q in rows], [question_dict(q) for q in rows]
+
+
+def quiz_summary(
+    prompt: str,
+    questions: List[dict],
+    ids: List[str],
+    new_count: int,
+    existing_count: int,
+    cached: bool = False,
+    bank_count: int = 0,
+    coalesced: bool = False,
+) -> dict:
+    return {
+        "message": "Questions processed successfully!",
+        "new_questions": new_count,
+        "existing_questions": existing_count,
+        "bank_questions": bank_count,
+        "prompt": prompt,
+        "topics": [q["topic"] for q in questions],
+        "difficulties": [q["difficulty"] for q in questions],
+        "companies": [q["company"] for q in questions],
+        "ids": ids,
+        "cached": cached,
+        "coalesced": coalesced
+    }
+
+
+async def _generate(
+    prompt: str,
+    total_questions: int,
+    done: int,
+    on_progress: Optional[ProgressCallback],
+    exclude: Optional[List[str]] = None,
+    engine: Optional[QuizGenerationEngine] = None,
+    surplus: Optional[List[dict]] = None,
+) -> List[dict]:
+    """Generate `total_questions` questions, reporting progress on top of `done` already in hand."""
+    questions: List[dict] = []
+    try:
+        async for batch in (engine or get_engine()).iter_large_quiz(
+            prompt,
+            total_questions=total_questions,
+            exclude=exclude,
+            surplus=surplus
+        ):
+            questions.extend(batch)
+            if on_progress:
+                on_progress(done + len(questions), done + total_questions)
+
+        # Final count validation
+        if len(questions) != total_questions:
+            raise ValueError(f"Generated {len(questions)} instead of {total_questions} questions")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to generate quiz: {str(e)}")
+    return questions
+
+
+def cache_scope(payload: PromptRequest) -> str:
+    """Prompt cache scope of a request: its explicit bank filters, if any."""
+    filters = [(value or "").lower() for value in (payload.topic, payload.difficulty, payload.company)]
+    if not any(filters):
+        return "general"
+    return "|".join(["general"] + filters)
+
+
+def flight_key(payload: PromptRequest, total_questions: int) -> str:
+    """Single-flight key: the prompt cache key plus the question count."""
+    prompt_key, _ = normalize_prompt(payload.prompt, cache_scope(payload))
+    return f"{prompt_key}|{total_questions}"
+
+
+def _cached_summary(
+    db: Session, payload: PromptRequest, total_questions: int, user_id: uuid.UUID, coalesced: bool = False
+) -> Optional[dict]:
+    prompt = payload.prompt
+    cached = load_cached_quiz(db, prompt, total_questions, user_id, cache_scope(payload))
+    if cached is None:
+        return None
+    cached_ids, cached_questions = cached
+    return quiz_summary(
+        prompt, cached_questions, cached_ids, 0, len(cached_ids), cached=True, coalesced=coalesced
+    )
+
+
+async def _assemble_quiz(
+    db: Session,
+    payload: PromptRequest,
+    user_id: uuid.UUID,
+    total_questions: int,
+    on_progress: Optional[ProgressCallback],
+) -> dict:
+    # Questions this user hasn't seen yet come straight from the bank;
+    # the LLM is only asked for the remainder. Database work runs in the
+    # threadpool so a slow round-trip never stalls the event loop.
+    bank_ids, bank_questions = await run_in_threadpool(pick_from_bank, db, payload, user_id, total_questions)
+    remaining = total_questions - len(bank_ids)
+    if on_progress:
+        on_progress(len(bank_ids), total_questions)
+
+    questions = []
+    question_ids, created_questions, existing_questions = [], [], []
+    if remaining:
+        surplus: List[dict] = []
+        started = time.perf_counter()
+        with track_usage(capture_raw=settings.PROMPT_LOG_STORE_RAW) as usage:
+            questions = await _generate(
+                payload.prompt, remaining, len(bank_ids), on_progress,
+                exclude=[q["question_text"] for q in bank_questions],
+                surplus=surplus
+            )
+        question_ids, created_questions, existing_questions = await run_in_threadpool(
+            _save_generation, db, payload.prompt, questions, usage, time.perf_counter() - started, surplus
+        )
+
+    # In question order, so ids line up with topics/difficulties and with a later cache hit
+    all_question_ids = bank_ids + question_ids
+    await run_in_threadpool(store_question_ids, db, payload.prompt, all_question_ids, cache_scope(payload))
+
+    return quiz_summary(
+        payload.prompt,
+        bank_questions + questions,
+        all_question_ids,
+        len(created_questions),
+        len(bank_ids) + len(existing_questions),
+        bank_count=len(bank_ids)
+    )
+
+
+async def generate_quiz(
+    db: Session,
+    payload: PromptRequest,
+    user_id: uuid.UUID,
+    on_progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Cache, then unseen bank questions, then the LLM for whatever is left.
+    Identical requests in flight at the same time share one generation.
+    Cached or shared questions are only used when the user hasn't seen any of
+    them yet. Returns the /generate/ response body.
+    """
+    total_questions = requested_question_count(payload.prompt)
+    if payload.fresh:
+        return await _assemble_quiz(db, payload, user_id, total_questions, on_progress)
+
+    # Equivalent prompts ("10 python questions") are served from already persisted
+    # questions without any LLM call, unless the client asks for a fresh set
+    summary = await run_in_threadpool(_cached_summary, db, payload, total_questions, user_id)
+    if summary is None:
+        # A class typing the same prompt at once runs one generation; the rest
+        # wait for it, in this worker or (via the prompt cache) in another one
+        summary, shared = await generation_flight.do(
+            flight_key(payload, total_questions),
+            lambda: _assemble_quiz(db, payload, user_id, total_questions, on_progress),
+            lookup=lambda: _cached_summary(db, payload, total_questions, user_id, coalesced=True),
+        )
+        if not shared:
+            return summary
+        if not summary["coalesced"]:
+            # Shared in this process; the leader's bank picks may be ones this user had
+            seen = await run_in_threadpool(
+                crud_question.any_seen, db, user_id, [uuid.UUID(i) for i in summary["ids"]]
+            )
+            if seen:
+                return await _assemble_quiz(db, payload, user_id, total_questions, on_progress)
+            # The leader's own summary; nothing was created for this caller
+            summary = {
+                **summary,
+                "new_questions": 0,
+                "existing_questions": len(summary["ids"]),
+                "coalesced": True,
+            }
+
+    if on_progress:
+        on_progress(len(summary["ids"]), total_questions)
+    return summary
+
+
+async def generate_resume_quiz(
+    db: Session,
+    resume_id: uuid.UUID,
+    user_prompt: str,
+    user_id: uuid.UUID,
+    on_progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """Generate a quiz from an uploaded resume and open a quiz session for it."""
+    # Fetch resume content
+    resume_entry = await run_in_threadpool(lambda: db.query(resume).filter(resume.id == resume_id).first())
+    if not resume_entry:
+        raise HTTPException(status_code=404, detail="Resume not found")
+    if not resume_entry.content:
+        raise HTTPException(status_code=400, detail="Resume content is empty")
+
+    # Prepare prompt for LLM
+    combined_prompt = f"{user_prompt}\n\nResume Content:\n{resume_entry.content[:5000]}"
+    total_questions = requested_question_count(user_prompt)
+
+    questions = await _generate(
+        combined_prompt, total_questions, 0, on_progress,
+        engine=get_engine("resume")
+    )
+
+    # Avoid duplicates (exact and rephrased) against the question bank
+    all_question_ids, created_questions, existing_questions = await run_in_threadpool(
+        crud_question.save_generated_questions,
+        db, questions, default_topic="Resume", default_difficulty="Medium"
+    )
+
+    # Create a new quiz session using crud_quiz, in the order the questions were generated
+    session_data = QuizSessionCreate(
+        question_ids=all_question_ids,
+        prompt=user_prompt,
+        topic="Resume",
+        difficulty="Medium",
+        company="Unknown"
+    )
+    new_session = await run_in_threadpool(crud_quiz.create_quiz_session, db, user_id, session_data)
+
+    return {
+        "message": "✅ Questions generated from resume successfully!",
+        "prompt": user_prompt,
+        "new_questions": len(created_questions),
+        "existing_questions": len(existing_questions),
+        "ids": all_question_ids,
+        "session_id": str(new_session.id)
+    }
@@ -1,172 +1,535 @@
+import asyncio
 import json
-import re
-from typing import List, Dict
-from app.services.gemini import get_gemini_response,get_bulk_gemini_response
+import math
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.gemini import generate_gemini_batch, stream_gemini_response, generation_config, DEFAULT_CONTEXT
+from app.services.gemini_resume import DEFAULT_CONTEXT as RESUME_CONTEXT
+from app.services.json_stream import IncrementalArrayParser, JSONStreamError, extract_json_objects
+from app.services.dedup import NearDuplicateIndex
+from app.services.batch_sizing import BatchSizer, topic_key
+from app.services.llm import estimate_tokens
+from app.services.metrics import metrics
+
+# Upper bound on Gemini calls in flight for a single quiz
+MAX_CONCURRENT_BATCHES = 4
+
+# Learned output tokens per question, per (profile, topic); picks batch sizes
+batch_sizer = BatchSizer(
+    max_output_tokens=generation_config.max_output_tokens, max_topics=settings.BATCH_SIZING_MAX_TOPICS
+)
+# Batches still running when their quiz completed, finishing only so their yield is recorded
+_observers: set = set()
 
 
 def clean_markdown_json(raw_response: str) -> str:
-    # Remove markdown code blocks and HTML comments
-    cleaned = re.sub(r"```(?:json)?\n?", "", raw_response)
-    cleaned = re.sub(r"<!--.*?-->", "", cleaned, flags=re.DOTALL)
-    
-    # Fix trailing commas in arrays/objects
-    cleaned = re.sub(r",\s*([\]}])", r"\1", cleaned)
-    
-    # Remove invalid control characters
-    cleaned = re.sub(r"[\x00-\x1F\x7F]", "", cleaned)
-    
-    # Extract first valid JSON array with bracket counting
-    stack = []
-    start_idx = None
-    for idx, ch in enumerate(cleaned):
-        if ch == '[':
-            if not stack:
-                start_idx = idx
-            stack.append(ch)
-        elif ch == ']':
-            if stack and stack[-1] == '[':
-                stack.pop()
-                if not stack:  # Found complete array
-                    json_str = cleaned[start_idx:idx+1]
-                    # Validate with actual JSON parser
-                    try:
-                        json.loads(json_str)
-                        return json_str
-                    except json.JSONDecodeError:
-                        continue
-    raise ValueError("❌ Could not extract valid JSON array")
-
-
-def generate_single_batch(prompt: str, total_questions: int) -> List[Dict]:
+    """
+    Extract the question array from a raw model response as a JSON string.
+    Markdown fences, comments and chatter around the array are skipped in a
+    single pass, and a response cut off mid-object keeps its complete objects.
+    """
+    objects, complete = extract_json_objects(raw_response)
+    if not objects and not complete:
+        raise ValueError("❌ Could not extract valid JSON array")
+    return json.dumps(objects)
+
+
+def validate_question(item) -> Optional[Dict]:
+    """
+    Map one raw MCQ object from the model onto our question fields.
+    Returns None when it lacks A-D options or a valid answer letter.
+    """
+    if not isinstance(item, dict):
+        return None
+    if not all(key in item for key in ("question", "options", "answer")):
+        return None
+
+    options = item.get("options", {})
+    if not isinstance(options, dict) or not all(k in options for k in ("A", "B", "C", "D")):
+        return None
+
+    transformed = {
+        "question_text": item["question"],
+        "option_a": options["A"],
+        "option_b": options["B"],
+        "option_c": options["C"],
+        "option_d": options["D"],
+        "correct_answer": str(item["answer"]).upper().strip(),
+        "explanation": item.get("explanation", ""),
+        "topic": item.get("topic", "General"),
+        "difficulty": item.get("difficulty", "medium").lower(),
+        "company": item.get("company", "Unknown")
+    }
+
+    if transformed["correct_answer"] not in ("A", "B", "C", "D"):
+        return None
+    return transformed
+
+
+def _record_batch(
+    sizing_key: Optional[Tuple[str, str]],
+    mode: str,
+    started: float,
+    outcome: str,
+    valid: int,
+    invalid: int,
+    salvaged: bool = False,
+):
+    profile = sizing_key[0] if sizing_key is not None else "unknown"
+    metrics.observe("batch_seconds", time.perf_counter() - started, profile=profile, mode=mode, outcome=outcome)
+    metrics.inc("batch_questions_total", valid, profile=profile)
+    if invalid:
+        metrics.inc("batch_invalid_questions_total", invalid, profile=profile)
+    if salvaged:
+        metrics.inc("batch_salvaged_total", profile=profile)
+
+
+async def iter_single_batch(
+    prompt: str,
+    total_questions: int,
+    context: str = DEFAULT_CONTEXT,
+    expected: Optional[int] = None,
+    max_invalid: int = 3,
+    sizing_key: Optional[Tuple[str, str]] = None,
+    bulk: Optional[bool] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Streaming mode of generate_single_batch: consume the model's token stream
+    through an incremental JSON-array parser and yield each validated question
+    as soon as its closing brace arrives.
+
+    The stream is aborted early (closing the upstream call) once `expected`
+    questions have arrived, when the output stops being a JSON array of
+    objects, or after `max_invalid` consecutive items fail validation.
+    Token usage is reported to the batch sizer under `sizing_key`.
+    """
+    started = time.perf_counter()
+    parser = IncrementalArrayParser()
+    stream = stream_gemini_response(prompt, context, bulk=total_questions > 50 if bulk is None else bulk)
+    emitted = 0
+    invalid_streak = 0
+    received: List[str] = []
+    parsed = 0
+    exhausted = False
+    failed = False
+    try:
+        async for chunk in stream:
+            received.append(chunk)
+            for item in parser.feed(chunk):
+                parsed += 1
+                question = validate_question(item)
+                if question is None:
+                    invalid_streak += 1
+                    if invalid_streak >= max_invalid:
+                        raise JSONStreamError(f"{invalid_streak} invalid questions in a row, aborting stream")
+                    continue
+                invalid_streak = 0
+                emitted += 1
+                yield question
+                if expected is not None and emitted >= expected:
+                    return
+            if parser.done:
+                return
+        exhausted = True
+    except Exception as e:
+        failed = True
+        if isinstance(e, JSONStreamError):
+            metrics.inc("batch_parse_failures_total", profile=sizing_key[0] if sizing_key else "unknown")
+        error_msg = f"Batch generation failed: {str(e)}"
+        print(f"🔥 {error_msg}")
+        if not emitted:
+            raise ValueError(error_msg)
+    finally:
+        await stream.aclose()
+        _record_batch(
+            sizing_key, "stream", started, "error" if failed or not emitted else "ok",
+            emitted, parsed - emitted, salvaged=exhausted and not parser.done and emitted > 0,
+        )
+        if sizing_key is not None and received:
+            # Streams don't report usage, so it's estimated from the text received;
+            # a stream that ran out before the array closed was cut off
+            batch_sizer.observe(
+                *sizing_key, estimate_tokens("".join(received)), parsed, truncated=exhausted and not parser.done
+            )
+
+    if not emitted:
+        error_msg = "Batch generation failed: No valid questions found in batch response"
+        print(f"🔥 {error_msg}")
+        raise ValueError(error_msg)
+
+
+async def generate_single_batch(
+    prompt: str,
+    total_questions: int,
+    context: str = DEFAULT_CONTEXT,
+    stream: bool = False,
+    sizing_key: Optional[Tuple[str, str]] = None,
+    bulk: Optional[bool] = None,
+) -> List[Dict]:
     """
     Generate and validate a batch of questions from Gemini response.
     Returns list of properly formatted question dictionaries.
+    With stream=True the response is parsed incrementally and bad output fails fast.
+    Token usage is reported to the batch sizer under `sizing_key`.
+    `bulk` picks the key pool; by default large quizzes go to the bulk keys.
     """
+    if stream:
+        return [
+            question
+            async for question in iter_single_batch(
+                prompt, total_questions, context, sizing_key=sizing_key, bulk=bulk
+            )
+        ]
+
+    started = time.perf_counter()
+    questions_data, complete = [], True
+    validated_questions = []
     try:
         # Choose the appropriate Gemini call based on total_questions
-        if total_questions <= 50:
-            raw_response = get_gemini_response(prompt)
-        else:
-            raw_response = get_bulk_gemini_response(prompt)
+        response = await generate_gemini_batch(
+            prompt, context, bulk=total_questions > 50 if bulk is None else bulk
+        )
+        raw_response = response.text
 
         if not raw_response.strip():
             raise ValueError("Empty response from Gemini")
 
-        # Clean and parse JSON (for both cases)
-        cleaned_json = clean_markdown_json(raw_response)
-        try:
-            questions_data = json.loads(cleaned_json)
-        except json.JSONDecodeError as e:
-            print("Raw AI response:", cleaned_json)  # Log the cleaned response for debugging
-            raise ValueError(f"Invalid JSON format: {str(e)}")
-
-        # Validate root structure
-        if not isinstance(questions_data, list):
-            raise ValueError("Top-level structure must be a JSON array")
-
-        validated_questions = []
+        # Single pass over the response; a truncated array still yields its complete objects
+        questions_data, complete = extract_json_objects(raw_response)
+        if not questions_data and not complete:
+            print("Raw AI response:", raw_response[:500])  # Log the response for debugging
+            metrics.inc("batch_parse_failures_total", profile=sizing_key[0] if sizing_key else "unknown")
+            raise ValueError("Could not extract valid JSON array")
+        if not complete:
+            print(f"Salvaged {len(questions_data)} questions from a truncated response")
+        if sizing_key is not None:
+            batch_sizer.observe(
+                *sizing_key, response.output_tokens, len(questions_data), truncated=response.truncated or not complete
+            )
 
         # Process each question item
-        for idx, item in enumerate(questions_data):
-            if not all(key in item for key in ("question", "options", "answer")):
-                continue
-
-            options = item.get("options", {})
-            if not all(k in options for k in ("A", "B", "C", "D")):
-                continue
-
-            try:
-                transformed = {
-                    "question_text": item["question"],
-                    "option_a": options["A"],
-                    "option_b": options["B"],
-                    "option_c": options["C"],
-                    "option_d": options["D"],
-                    "correct_answer": str(item["answer"]).upper().strip(),
-                    "explanation": item.get("explanation", ""),
-                    "topic": item.get("topic", "General"),
-                    "difficulty": item.get("difficulty", "medium").lower(),
-                    "company": item.get("company", "Unknown")
-                }
-
-                if transformed["correct_answer"] not in ("A", "B", "C", "D"):
-                    continue
-
+        for item in questions_data:
+            transformed = validate_question(item)
+            if transformed is not None:
                 validated_questions.append(transformed)
 
-            except KeyError:
-                continue
-
         if not validated_questions:
             raise ValueError("No valid questions found in batch response")
 
+        _record_batch(
+            sizing_key, "generate", started, "ok", len(validated_questions),
+            len(questions_data) - len(validated_questions), salvaged=not complete,
+        )
         return validated_questions
 
     except Exception as e:
+        _record_batch(sizing_key, "generate", started, "error", 0, len(questions_data))
         error_msg = f"Batch generation failed: {str(e)}"
         print(f"🔥 {error_msg}")
         raise ValueError(error_msg)
 
-    
 
-def generate_large_quiz(
+def _plan_batches(total_questions: int, batch_size: int) -> List[int]:
+    """Split a quiz into batch sizes, e.g. 45 with batch_size 20 -> [20, 20, 5]."""
+    batch_size = max(1, batch_size)
+    full_batches, remainder = divmod(total_questions, batch_size)
+    sizes = [batch_size] * full_batches
+    if remainder:
+        sizes.append(remainder)
+    return sizes
+
+
+def _plan_requests(total_questions: int, batch_size: int, yield_ratio: float) -> Tuple[List[int], List[int]]:
+    """
+    Split a quiz into per-batch targets and how many questions each batch asks
+    for: enough that the expected share lost to validation and dedup still
+    leaves the target, without going over `batch_size`.
+    e.g. 40 with batch_size 20 and yield 0.8 -> targets [16, 16, 8], requests [20, 20, 10].
+    """
+    per_batch = max(1, min(total_questions, int(batch_size * yield_ratio)))
+    targets = _plan_batches(total_questions, per_batch)
+    return targets, [min(batch_size, max(target, math.ceil(target / yield_ratio))) for target in targets]
+
+
+def _batch_prompt(prompt: str, batch_size: int, batch_number: int, batch_count: int) -> str:
+    return (
+        f"{prompt}\n\n"
+        f"CRITICAL: Generate EXACTLY {batch_size} UNIQUE questions. "
+        f"DO NOT RETURN MORE THAN {batch_size} ITEMS. "
+        f"Make sure each question is different from previous ones. "
+        f"This is batch {batch_number} of {batch_count}, generated in parallel with the others, "
+        f"so cover different sub-topics and angles than the other batches would."
+    )
+
+
+async def iter_batches(
     prompt: str,
-    total_questions: int = 500,
-    batch_size: int = 20
-) -> List[Dict]:
-    full: List[Dict] = []
-    # Keep track of all question texts to ensure global uniqueness
-    all_question_texts = set()
-    
-    while len(full) < total_questions:
-        remaining = total_questions - len(full)
-        current_batch_size = min(batch_size, remaining)
-
-        total_questions=total_questions
-        batch_prompt = (
-            f"{prompt}\n\n"
-            f"CRITICAL: Generate EXACTLY {current_batch_size} UNIQUE questions. "
-            f"DO NOT RETURN MORE THAN {current_batch_size} ITEMS. "
-            f"Make sure each question is different from previous ones. "
-            f"Current progress: {len(full)}/{total_questions} generated."
-        )
-        
-        unique_batch = []
+    batch_sizes: List[int],
+    total_questions: int,
+    all_question_texts: NearDuplicateIndex,
+    context: str = DEFAULT_CONTEXT,
+    max_concurrency: int = MAX_CONCURRENT_BATCHES,
+    stream: bool = False,
+    sizing_key: Optional[Tuple[str, str]] = None,
+    requests: Optional[List[int]] = None,
+    surplus: Optional[List[Dict]] = None,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Fan out all batches at once with at most `max_concurrency` Gemini calls in flight,
+    merging results through the shared uniqueness set and yielding unique questions
+    as soon as they arrive: per finished batch, or per parsed question with stream=True.
+    A failed batch is logged and skipped; the caller tops up the shortfall.
+
+    `requests` (default `batch_sizes`) is how many questions each batch asks
+    for, so a batch can over-ask to cover its expected losses. Unique questions
+    past the total of `batch_sizes` go to `surplus` instead of being dropped.
+    Once every batch has finished (in the background, for any still running
+    when the total is reached) their yields are reported to the batch sizer.
+    """
+    if not batch_sizes:
+        return
+
+    target = sum(batch_sizes)
+    requests = requests or batch_sizes
+    batch_count = len(batch_sizes)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    # Each batch task pushes (number, questions), then (number, None, succeeded) when it finishes
+    arrivals: asyncio.Queue = asyncio.Queue()
+    profile = sizing_key[0] if sizing_key else "unknown"
+
+    async def run_batch(request: int, number: int):
+        batch_prompt = _batch_prompt(prompt, request, number, batch_count)
+        succeeded = False
         try:
-            batch =generate_single_batch(batch_prompt,total_questions)
-            
-            # Filter out any questions that duplicate previously generated ones
-            for question in batch:
-                if question["question_text"] not in all_question_texts:
-                    unique_batch.append(question)
-                    all_question_texts.add(question["question_text"])
+            async with semaphore:
+                if stream:
+                    async for question in iter_single_batch(
+                        batch_prompt, total_questions, context, expected=request, sizing_key=sizing_key
+                    ):
+                        arrivals.put_nowait((number, [question]))
                 else:
-                    print(f"Found duplicate question")
-            
-            # If batch is incomplete after filtering, generate missing questions
-            if len(unique_batch) < current_batch_size:
-                print(f"Short batch after uniqueness check: {len(unique_batch)}/{current_batch_size}")
-                unique_batch = fill_missing_questions(prompt, unique_batch, current_batch_size, all_question_texts)
-            
-            # Add batch to full set
-            full.extend(unique_batch)
-            print(f"Progress: {len(full)}/{total_questions} unique questions generated")
-            
+                    arrivals.put_nowait((
+                        number,
+                        await generate_single_batch(batch_prompt, total_questions, context, sizing_key=sizing_key),
+                    ))
+            succeeded = True
         except Exception as e:
             print(f"Batch generation error: {str(e)}")
-            # If we have some questions, continue with what we have
-            if len(unique_batch) > 0:
-                full.extend(unique_batch)
-                print(f"Added partial batch of {len(unique_batch)} questions")
-        
+        finally:
+            arrivals.put_nowait((number, None, succeeded))
+
+    tasks = [
+        asyncio.ensure_future(run_batch(request, number))
+        for number, request in enumerate(requests, start=1)
+    ]
+    running = len(tasks)
+    emitted = 0
+    kept = [0] * (batch_count + 1)
+    succeeded = []
+    completed = False
+
+    def unique_questions(number: int, batch: List[Dict]) -> List[Dict]:
+        # Filter out any questions that duplicate previously generated ones
+        unique = []
+        for question in batch:
+            if question["question_text"] in all_question_texts:
+                metrics.inc("duplicates_dropped_total", profile=profile)
+                continue
+            all_question_texts.add(question["question_text"])
+            kept[number] += 1
+            unique.append(question)
+        return unique
+
+    def record_yields():
+        for number in succeeded:
+            batch_sizer.observe_yield(*sizing_key, requests[number - 1], kept[number])
+
+    async def observe_rest(running: int):
+        # The quiz is complete; the late batches only count toward the yields
+        while running:
+            number, batch, *finished = await arrivals.get()
+            if batch is None:
+                running -= 1
+                if finished[0]:
+                    succeeded.append(number)
+            else:
+                unique_questions(number, batch)
+        record_yields()
+
+    try:
+        while running and emitted < target:
+            number, batch, *finished = await arrivals.get()
+            if batch is None:
+                running -= 1
+                if finished[0]:
+                    succeeded.append(number)
+                continue
+
+            unique_batch = []
+            for question in unique_questions(number, batch):
+                if emitted + len(unique_batch) < target:
+                    unique_batch.append(question)
+                elif surplus is not None:
+                    surplus.append(question)
+
+            emitted += len(unique_batch)
+            if unique_batch:
+                print(f"Progress: {emitted}/{target} unique questions generated")
+                yield unique_batch
+        completed = True
+    finally:
+        if not completed or sizing_key is None:
+            # Stop paying for batches nobody is waiting on (e.g. a streaming client
+            # went away); a run cut short records no yields, so none are skewed
+            for task in tasks:
+                task.cancel()
+        elif running:
+            # Only recording the batches that beat the target would bias the
+            # learned yield toward the fastest responses, so the rest finish
+            # in the background before any of the run's yields are recorded
+            observer = asyncio.ensure_future(observe_rest(running))
+            _observers.add(observer)
+            observer.add_done_callback(_observers.discard)
+        else:
+            record_yields()
+
+
+async def run_batches(
+    prompt: str,
+    batch_sizes: List[int],
+    total_questions: int,
+    all_question_texts: NearDuplicateIndex,
+    context: str = DEFAULT_CONTEXT,
+    max_concurrency: int = MAX_CONCURRENT_BATCHES,
+    stream: bool = False,
+    sizing_key: Optional[Tuple[str, str]] = None,
+    requests: Optional[List[int]] = None,
+    surplus: Optional[List[Dict]] = None,
+) -> List[Dict]:
+    unique_questions: List[Dict] = []
+    async for batch in iter_batches(
+        prompt, batch_sizes, total_questions, all_question_texts,
+        context=context, max_concurrency=max_concurrency, stream=stream, sizing_key=sizing_key,
+        requests=requests, surplus=surplus,
+    ):
+        unique_questions.extend(batch)
+    return unique_questions
+
+
+async def iter_large_quiz(
+    prompt: str,
+    total_questions: int = 500,
+    batch_size: Optional[int] = None,
+    context: str = DEFAULT_CONTEXT,
+    max_concurrency: int = MAX_CONCURRENT_BATCHES,
+    max_rounds: int = 3,
+    stream: bool = False,
+    exclude: Optional[List[str]] = None,
+    profile: str = "general",
+    surplus: Optional[List[Dict]] = None,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Yield validated, globally unique batches of a quiz as they arrive.
+    The batches add up to at most `total_questions`. With stream=True each
+    batch's token stream is parsed incrementally and questions are yielded
+    as they complete instead of once per finished batch. Questions matching
+    a text in `exclude` (e.g. ones already taken from the bank) are dropped.
+    Without an explicit `batch_size` the batch sizer picks one from the
+    output tokens per question seen for this profile and topic.
+
+    Batches ask for more than they need by the yield seen for this profile
+    and topic, so the usual case needs no refill call; unique questions left
+    over are appended to `surplus` for the caller to bank.
+    """
+    sizing_key = (profile, topic_key(prompt))
+    if batch_size is None:
+        batch_size = batch_sizer.batch_size(*sizing_key)
+    batch_size = max(1, batch_size)
+    yield_ratio = batch_sizer.yield_ratio(*sizing_key)
+    generated = 0
+    # Keep track of all question texts to ensure global uniqueness; the index
+    # also catches rephrased near-duplicates, not just identical text
+    all_question_texts = NearDuplicateIndex()
+    for text in exclude or ():
+        all_question_texts.add(text)
+
+    # Every needed batch is requested up front, so wall-clock time is roughly
+    # the slowest single batch rather than the sum of all of them.
+    rounds = 0
+    while generated < total_questions and rounds < max_rounds:
+        remaining = total_questions - generated
+        # A small shortfall is cheaper to top up with one targeted call
+        if rounds > 0 and remaining < batch_size:
+            break
+        targets, requests = _plan_requests(remaining, batch_size, yield_ratio)
+        async for batch in iter_batches(
+            prompt,
+            targets,
+            total_questions,
+            all_question_texts,
+            context=context,
+            max_concurrency=max_concurrency,
+            stream=stream,
+            sizing_key=sizing_key,
+            requests=requests,
+            surplus=surplus,
+        ):
+            batch = batch[:total_questions - generated]
+            generated += len(batch)
+            yield batch
+        rounds += 1
+
+    # Only the real shortfall left after validation and dedup goes to the refill path
+    if generated < total_questions:
+        print(f"Short after uniqueness check: {generated}/{total_questions}")
+        topped_up = await fill_missing_questions(
+            prompt, [], total_questions - generated, all_question_texts,
+            context=context, stream=stream, sizing_key=sizing_key, surplus=surplus
+        )
+        if topped_up:
+            yield topped_up[:total_questions - generated]
+
+
+async def generate_large_quiz(
+    prompt: str,
+    total_questions: int = 500,
+    batch_size: Optional[int] = None,
+    context: str = DEFAULT_CONTEXT,
+    max_concurrency: int = MAX_CONCURRENT_BATCHES,
+    max_rounds: int = 3,
+    stream: bool = False,
+    exclude: Optional[List[str]] = None,
+    profile: str = "general",
+    surplus: Optional[List[Dict]] = None,
+) -> List[Dict]:
+    full: List[Dict] = []
+    async for batch in iter_large_quiz(
+        prompt,
+        total_questions=total_questions,
+        batch_size=batch_size,
+        context=context,
+        max_concurrency=max_concurrency,
+        max_rounds=max_rounds,
+        stream=stream,
+        exclude=exclude,
+        profile=profile,
+        surplus=surplus,
+    ):
+        full.extend(batch)
     return full[:total_questions]
 
-def fill_missing_questions(
+async def fill_missing_questions(
     prompt: str, 
     current_batch: List[Dict], 
     target_size: int,
-    all_question_texts: set,
-    max_attempts: int = 3
+    all_question_texts: NearDuplicateIndex,
+    max_attempts: int = 3,
+    context: str = DEFAULT_CONTEXT,
+    stream: bool = False,
+    sizing_key: Optional[Tuple[str, str]] = None,
+    surplus: Optional[List[Dict]] = None
 ) -> List[Dict]:
     """
     Generates exactly the missing number of questions needed to complete a batch,
@@ -176,8 +539,12 @@ def fill_missing_questions(
         prompt: The base prompt to use
         current_batch: The current incomplete batch of questions
         target_size: The desired batch size
-        all_question_texts: Set of all question texts already generated
+        all_question_texts: Index of all question texts already generated (near-duplicates count as taken)
         max_attempts: Maximum number of attempts to fill the batch
+        context: The system context to generate with (general or resume)
+        stream: Parse the model output incrementally so bad output fails fast
+        sizing_key: (profile, topic) the batch sizer records token usage and yield under
+        surplus: Collects unique questions asked for beyond the missing count
     
     Returns:
         List[Dict]: The completed batch with additional questions
@@ -191,34 +558,54 @@ def fill_missing_questions(
     print(f"Attempting to generate exactly {total_questions} missing unique questions...")
     
     combined_batch = current_batch.copy()
+    profile = sizing_key[0] if sizing_key is not None else "unknown"
     
     attempts = 0
     while len(combined_batch) < target_size and attempts < max_attempts:
+        metrics.inc("refill_attempts_total", profile=profile)
         try:
+            # Ask for enough extra to cover the usual losses, so one call normally does it
+            request = total_questions
+            if sizing_key is not None:
+                request = min(
+                    max(total_questions, batch_sizer.batch_size(*sizing_key)),
+                    math.ceil(total_questions / batch_sizer.yield_ratio(*sizing_key)),
+                )
+
             # Create a prompt specifically for the missing questions
             fill_prompt = (
                 f"{prompt}\n\n"
-                f"CRITICAL: Generate EXACTLY {total_questions} unique questions. "
-                f"I already have {len(current_batch)} questions in this batch. "
-                f"I need EXACTLY {total_questions} MORE UNIQUE questions to complete the batch."
+                f"CRITICAL: Generate EXACTLY {request} unique questions. "
+                f"I already have {len(combined_batch)} questions in this batch. "
+                f"I need EXACTLY {request} MORE UNIQUE questions to complete the batch."
             )
             
             # Generate just the missing questions
-            additional_questions =generate_single_batch(fill_prompt,total_questions)
+            additional_questions =await generate_single_batch(fill_prompt,request,context,stream=stream,sizing_key=sizing_key)
             
             # Filter out any duplicates against ALL previously generated questions
             added_count = 0
+            unique_count = 0
             for q in additional_questions:
                 if q["question_text"] not in all_question_texts:
-                    combined_batch.append(q)
                     all_question_texts.add(q["question_text"])
-                    added_count += 1
+                    unique_count += 1
+                    if len(combined_batch) < target_size:
+                        combined_batch.append(q)
+                        added_count += 1
+                    elif surplus is not None:
+                        surplus.append(q)
+                else:
+                    metrics.inc("duplicates_dropped_total", profile=profile)
+            metrics.inc("refill_questions_total", added_count, profile=profile)
+            if sizing_key is not None:
+                batch_sizer.observe_yield(*sizing_key, request, unique_count)
             
             # If we still need more, calculate how many are still missing
             still_missing = target_size - len(combined_batch)
             if still_missing > 0:
                 print(f"Added {added_count} unique questions. Still need {still_missing} more.")
-                missing_count = still_missing
+                total_questions = still_missing
             else:
                 print(f"Successfully added {added_count} unique questions to complete the batch.")
                 break
@@ -229,4 +616,110 @@ def fill_missing_questions(
         attempts += 1
     
     print(f"Final batch size: {len(combined_batch)}/{target_size}")
-    return combined_batch
\ No newline at end of file
+    return combined_batch
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """What sets one kind of quiz apart: its name (the batch sizer's profile) and system context."""
+    name: str
+    context: str
+
+
+class QuizGenerationEngine:
+    """
+    The generation pipeline bound to one profile. Every profile runs through
+    the same batching, streaming parser, dedup index, key pool and batch
+    sizer above, so an optimization there reaches all of them.
+    """
+
+    def __init__(self, profile: GenerationProfile, max_concurrency: int = MAX_CONCURRENT_BATCHES):
+        self.profile = profile
+        self.max_concurrency = max_concurrency
+
+    def iter_large_quiz(
+        self,
+        prompt: str,
+        total_questions: int = 500,
+        batch_size: Optional[int] = None,
+        stream: bool = False,
+        exclude: Optional[List[str]] = None,
+        surplus: Optional[List[Dict]] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        return iter_large_quiz(
+            prompt,
+            total_questions=total_questions,
+            batch_size=batch_size,
+            context=self.profile.context,
+            max_concurrency=self.max_concurrency,
+            stream=stream,
+            exclude=exclude,
+            profile=self.profile.name,
+            surplus=surplus,
+        )
+
+    async def generate_large_quiz(
+        self,
+        prompt: str,
+        total_questions: int = 500,
+        batch_size: Optional[int] = None,
+        stream: bool = False,
+        exclude: Optional[List[str]] = None,
+        surplus: Optional[List[Dict]] = None,
+    ) -> List[Dict]:
+        return await generate_large_quiz(
+            prompt,
+            total_questions=total_questions,
+            batch_size=batch_size,
+            context=self.profile.context,
+            max_concurrency=self.max_concurrency,
+            stream=stream,
+            exclude=exclude,
+            profile=self.profile.name,
+            surplus=surplus,
+        )
+
+    async def generate_single_batch(self, prompt: str, total_questions: int, stream: bool = False) -> List[Dict]:
+        return await generate_single_batch(
+            prompt, total_questions, self.profile.context,
+            stream=stream, sizing_key=(self.profile.name, topic_key(prompt))
+        )
+
+    async def fill_missing_questions(
+        self,
+        prompt: str,
+        current_batch: List[Dict],
+        target_size: int,
+        all_question_texts: NearDuplicateIndex,
+        max_attempts: int = 3,
+        stream: bool = False,
+        surplus: Optional[List[Dict]] = None,
+    ) -> List[Dict]:
+        return await fill_missing_questions(
+            prompt, current_batch, target_size, all_question_texts,
+            max_attempts=max_attempts, context=self.profile.context, stream=stream,
+            sizing_key=(self.profile.name, topic_key(prompt)), surplus=surplus
+        )
+
+
+PROFILES: Dict[str, GenerationProfile] = {
+    "general": GenerationProfile("general", DEFAULT_CONTEXT),
+    "resume": GenerationProfile("resume", RESUME_CONTEXT),
+}
+
+_engines: Dict[str, QuizGenerationEngine] = {}
+
+
+def get_engine(profile: str = "general") -> QuizGenerationEngine:
+    """The shared engine for a registered profile."""
+    if profile not in _engines:
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown generation profile: {profile}")
+        _engines[profile] = QuizGenerationEngine(PROFILES[profile])
+    return _engines[profile]
+
+
+def register_profile(profile: GenerationProfile) -> QuizGenerationEngine:
+    """Add (or replace) a profile and return its engine."""
+    PROFILES[profile.name] = profile
+    _engines.pop(profile.name, None)
+    return get_engine(profile.name)
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.db.models import GenerationLock, utcnow
+from app.db.session import SessionLocal
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class LocalBackend:
+    """Coalesces within this process only: every key is always free to lead."""
+
+    def acquire(self, key: str) -> bool:
+        return True
+
+    def release(self, key: str) -> None:
+        pass
+
+    def held(self, key: str) -> bool:
+        return False
+
+
+class DatabaseBackend:
+    """
+    Cross-worker leases in the generation_locks table. Inserting the key's row
+    makes this worker the leader; the primary key rejects everyone else until
+    the row is deleted or its lease runs out.
+    """
+
+    def __init__(self, ttl_seconds: int = settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS, session_factory=SessionLocal):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.session_factory = session_factory
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+    def acquire(self, key: str) -> bool:
+        key_hash = _key_hash(key)
+        db = self.session_factory()
+        try:
+            now = utcnow()
+            # Take over a lease its leader never released (crash, redeploy)
+            taken = (
+                db.query(GenerationLock)
+                .filter(GenerationLock.key_hash == key_hash, GenerationLock.expires_at <= now)
+                .update({"owner": self.owner, "expires_at": now + self.ttl}, synchronize_session=False)
+            )
+            if not taken:
+                db.add(GenerationLock(key_hash=key_hash, owner=self.owner, expires_at=now + self.ttl))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def release(self, key: str) -> None:
+        db = self.session_factory()
+        try:
+            db.query(GenerationLock).filter(
+                GenerationLock.key_hash == _key_hash(key),
+                GenerationLock.owner == self.owner,
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            # The lease runs out on its own; never fail a generation over it
+            db.rollback()
+            print(f"Failed to release generation lock: {str(e)}")
+        finally:
+            db.close()
+
+    def held(self, key: str) -> bool:
+        db = self.session_factory()
+        try:
+            return db.query(GenerationLock.key_hash).filter(
+                GenerationLock.key_hash == _key_hash(key),
+                GenerationLock.expires_at > utcnow(),
+            ).first() is not None
+        finally:
+            db.close()
+
+
+class SingleFlight:
+    """
+    At most one call per key runs at a time. Callers in this process that
+    arrive while their key is in flight await the running call and share its
+    result. Across workers the backend's lock decides the leader; the others
+    wait for it to finish and pick its result up through `lookup`.
+    """
+
+    def __init__(self, backend=None, poll_interval: float = settings.SINGLE_FLIGHT_POLL_SECONDS):
+        self.backend = backend or LocalBackend()
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    @property
+    def active(self) -> int:
+        """Keys with a call running in this process."""
+        return len(self._calls)
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        lookup: Optional[Callable[[], Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """
+        Run `fn()` for `key`, or share the result of the call already running.
+        Returns (result, shared). When another worker holds the key, waits for
+        it and returns `lookup()` if that finds its result, else runs `fn` here.
+        `lookup` is synchronous and runs in the threadpool.
+        """
+        while key in self._calls:
+            call = self._calls[key]
+            try:
+                # Shielded: a follower going away must not cancel the leader
+                return await asyncio.shield(call), True
+            except asyncio.CancelledError:
+                if not call.cancelled():
+                    raise
+                # The leader was cancelled, not us; take over
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        try:
+            result, shared = await self._lead(key, fn, lookup)
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            # Mark it retrieved; with no followers nobody else will
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result, shared
+        finally:
+            self._calls.pop(key, None)
+
+    async def _backend(self, method: Callable[[str], Any], key: str) -> Any:
+        if isinstance(self.backend, LocalBackend):
+            return method(key)
+        # Lease calls are database round-trips; keep them off the event loop
+        return await run_in_threadpool(method, key)
+
+    async def _lead(self, key: str, fn, lookup) -> Tuple[Any, bool]:
+        while not await self._backend(self.backend.acquire, key):
+            # Another worker is generating this key; wait until it lets go
+            while await self._backend(self.backend.held, key):
+                await asyncio.sleep(self.poll_interval)
+            if lookup is not None:
+                result = await run_in_threadpool(lookup)
+                if result is not None:
+                    return result, True
+        try:
+            return await fn(), False
+        finally:
+            await self._backend(self.backend.release, key)
+
+
+def _make_backend():
+    if settings.SINGLE_FLIGHT_BACKEND == "database":
+        return DatabaseBackend()
+    return LocalBackend()
+
+
+# Shared by every generation request in this process
+generation_flight = SingleFlight(_make_backend())
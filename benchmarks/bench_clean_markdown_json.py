@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: extracting the question array from raw Gemini responses.
+
+Compares the previous regex + bracket-counting clean_markdown_json against the
+single-pass extractor over a corpus of raw responses (fenced, chatty, trailing
+commas, a bracketed aside before the array, truncated at max_output_tokens,
+100-question bulk batches).
+
+    python -m benchmarks.bench_clean_markdown_json [--corpus DIR] [--repeat N]
+
+Any *.txt file in the corpus directory is treated as one raw model response,
+so recordings captured from production can be dropped in alongside the samples.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.json_stream import extract_json_objects  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def legacy_clean_markdown_json(raw_response: str) -> str:
+    """The implementation this benchmark replaced, kept verbatim for comparison."""
+    cleaned = re.sub(r"```(?:json)?\n?", "", raw_response)
+    cleaned = re.sub(r"<!--.*?-->", "", cleaned, flags=re.DOTALL)
+    cleaned = re.sub(r",\s*([\]}])", r"\1", cleaned)
+    cleaned = re.sub(r"[\x00-\x1F\x7F]", "", cleaned)
+    stack = []
+    start_idx = None
+    for idx, ch in enumerate(cleaned):
+        if ch == '[':
+            if not stack:
+                start_idx = idx
+            stack.append(ch)
+        elif ch == ']':
+            if stack and stack[-1] == '[':
+                stack.pop()
+                if not stack:
+                    json_str = cleaned[start_idx:idx+1]
+                    try:
+                        json.loads(json_str)
+                        return json_str
+                    except json.JSONDecodeError:
+                        continue
+    raise ValueError("❌ Could not extract valid JSON array")
+
+
+def legacy_extract(raw: str) -> int:
+    try:
+        return len(json.loads(legacy_clean_markdown_json(raw)))
+    except ValueError:
+        return 0
+
+
+def single_pass_extract(raw: str) -> int:
+    return len(extract_json_objects(raw)[0])
+
+
+def load_corpus(path: str):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".txt"):
+            with open(os.path.join(path, name), encoding="utf-8") as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No *.txt responses found in {args.corpus}")
+
+    print(f"{'response':42} {'KiB':>6} {'legacy us':>10} {'new us':>10} {'speedup':>8} {'legacy q':>9} {'new q':>6}")
+    totals = [0.0, 0.0, 0, 0]
+    for name, raw in corpus:
+        legacy_time = min(timeit.repeat(lambda: legacy_extract(raw), number=args.repeat, repeat=3)) / args.repeat
+        new_time = min(timeit.repeat(lambda: single_pass_extract(raw), number=args.repeat, repeat=3)) / args.repeat
+        legacy_count = legacy_extract(raw)
+        new_count = single_pass_extract(raw)
+        totals[0] += legacy_time
+        totals[1] += new_time
+        totals[2] += legacy_count
+        totals[3] += new_count
+        print(
+            f"{name:42} {len(raw) / 1024:6.1f} {legacy_time * 1e6:10.1f} {new_time * 1e6:10.1f} "
+            f"{legacy_time / new_time:7.2f}x {legacy_count:9d} {new_count:6d}"
+        )
+    print(
+        f"{'TOTAL':42} {'':6} {totals[0] * 1e6:10.1f} {totals[1] * 1e6:10.1f} "
+        f"{totals[0] / totals[1]:7.2f}x {totals[2]:9d} {totals[3]:6d}"
+    )
+
+
+if __name__ == "__main__":
+    main()
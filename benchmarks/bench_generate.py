@@ -0,0 +1,166 @@
+"""
+End-to-end benchmark of POST /generate/ that runs with no network.
+
+The questions router runs in-process against a throwaway SQLite database, and
+the LLM is a ReplayProvider serving a cassette (recorded with
+LLM_RECORD_CASSETTE=path, or seeded from stored generations with
+benchmarks.seed_cassette). Prompts the cassette can't answer fall back to the
+deterministic FakeProvider, so it also runs with no cassette at all.
+
+    python -m benchmarks.bench_generate [--cassette FILE] [--requests N] [--concurrency C]
+        [--questions Q] [--latency S] [--jitter S] [--failure-rate F] [--keys K] [--rpm R] [--warm]
+
+Reports throughput, p50/p99 request latency, LLM calls and DB writes per quiz.
+Requests ask for fresh questions (no prompt cache, no bank) unless --warm.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Keep everything in this process: no cross-worker lock table, no background pools
+os.environ.setdefault("SINGLE_FLIGHT_BACKEND", "local")
+os.environ.setdefault("PREGEN_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.api.deps import get_current_user  # noqa: E402
+from app.api.routes.questions import router as questions_router  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.models import User  # noqa: E402
+from app.db.session import get_db  # noqa: E402
+from app.services.cassettes import Cassette, ReplayProvider  # noqa: E402
+from app.services.key_pool import CircuitBreaker, KeyPool, PooledKey  # noqa: E402
+from app.services.llm import FakeProvider, set_provider  # noqa: E402
+from app.services.metrics import metrics  # noqa: E402
+
+TOPICS = ["Python", "SQL", "data structures and algorithms", "system design", "JavaScript", "operating systems"]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def build_app(database_path: str):
+    engine = create_engine(
+        f"sqlite:///{database_path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    writes = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            writes["count"] += len(parameters) if executemany else 1
+
+    db = SessionLocal()
+    user = User(id=uuid.uuid4(), name="bench", email="bench@example.com", password_hash="-", is_verified=True)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+
+    def bench_db():
+        session = SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = FastAPI()
+    app.include_router(questions_router)
+    app.dependency_overrides[get_db] = bench_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    return app, writes
+
+
+async def run(args):
+    cassette = Cassette.load(args.cassette) if args.cassette else Cassette()
+    provider = ReplayProvider(
+        cassette,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        fallback=FakeProvider(),
+        seed=args.seed,
+    )
+    # The replay sits behind a key pool like Gemini does, so injected 429/503s
+    # go through the same retries and circuit breakers
+    keys = [
+        PooledKey(f"replay-{n}", provider, rpm=args.rpm, tpm=10 ** 9, breaker=CircuitBreaker())
+        for n in range(1, args.keys + 1)
+    ]
+    set_provider(KeyPool(keys, backoff_base=0.05))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, writes = build_app(os.path.join(tmp, "bench.db"))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies, failures = [], 0
+
+        async def one(number: int, client: httpx.AsyncClient):
+            nonlocal failures
+            topic = TOPICS[number % len(TOPICS)]
+            payload = {"prompt": f"{args.questions} {topic} questions", "fresh": not args.warm}
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/generate/", json=payload)
+                elapsed = time.perf_counter() - started
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                failures += 1
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n, client) for n in range(args.requests)))
+            wall = time.perf_counter() - started
+
+    done = max(1, len(latencies))
+    counters = metrics.snapshot()["counters"]
+
+    def total(name: str) -> float:
+        return sum(item["value"] for item in counters.get(name, []))
+
+    print(f"cassette:           {args.cassette or '(none, FakeProvider fallback)'} ({len(cassette)} responses)")
+    print(f"requests:           {args.requests} at concurrency {args.concurrency}, {failures} failed")
+    print(f"throughput:         {len(latencies) / wall:.2f} quizzes/s ({wall:.2f}s wall)")
+    print(f"latency p50 / p99:  {percentile(latencies, 0.5) * 1000:.0f} / {percentile(latencies, 0.99) * 1000:.0f} ms")
+    print(f"LLM calls / quiz:   {provider.calls / done:.2f} ({provider.failures} injected failures)")
+    print(f"DB writes / quiz:   {writes['count'] / done:.1f}")
+    print(f"duplicates dropped: {total('duplicates_dropped_total'):.0f}, refill attempts: {total('refill_attempts_total'):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cassette", help="JSONL cassette to replay (default: none)")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=25, help="questions per quiz (the API caps it at 25)")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± seconds around --latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of LLM calls failing with 429/503")
+    parser.add_argument("--keys", type=int, default=2, help="replayed API keys in the pool")
+    parser.add_argument("--rpm", type=int, default=10 ** 6, help="requests per minute per replayed key")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="let the prompt cache and question bank serve requests")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: creating a quiz session and its question links.
+
+Compares the previous one-ORM-object-per-link create_quiz_session (plus its
+refresh) against the executemany INSERT version, at several quiz sizes, on a
+throwaway SQLite database.
+
+    python -m benchmarks.bench_session_create [--sizes 25,500,5000] [--repeat N]
+
+Reports the median time per session and the statements sent for each.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.crud import crud_quiz  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.models import QuizSession, QuizSessionQuestion, User  # noqa: E402
+from app.schemas.quiz_session import QuizSessionCreate  # noqa: E402
+
+
+def legacy_create_quiz_session(db, user_id, session_data):
+    """The implementation this benchmark replaced, kept verbatim for comparison."""
+    num_questions = len(session_data.question_ids)
+    duration_minutes = round(num_questions * 1.5, 2)
+
+    session = QuizSession(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        prompt=session_data.prompt,
+        topic=session_data.topic,
+        difficulty=session_data.difficulty,
+        company=session_data.company,
+        num_questions=num_questions,
+        total_duration=duration_minutes,
+        started_at=None,
+        submitted_at=None
+    )
+    db.add(session)
+    db.flush()  # So we get session.id
+
+    for idx, qid in enumerate(session_data.question_ids):
+        session_question = QuizSessionQuestion(
+            id=uuid.uuid4(),
+            quiz_session_id=session.id,
+            question_id=qid,
+            question_order=idx + 1,
+        )
+        db.add(session_question)
+
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        statements = {"count": 0}
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statements(conn, cursor, statement, parameters, context, executemany):
+            statements["count"] += 1
+
+        db = SessionLocal()
+        user = User(id=uuid.uuid4(), name="bench", email="bench@example.com", password_hash="-", is_verified=True)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+
+        print(f"{'questions':>9}  {'implementation':<14} {'median ms':>10} {'statements':>10}")
+        for size in args.sizes:
+            # Links only reference question ids; SQLite doesn't enforce the foreign key
+            session_data = QuizSessionCreate(
+                prompt=f"{size} benchmark questions", topic="Benchmark", difficulty="easy", company="Unknown",
+                question_ids=[uuid.uuid4() for _ in range(size)],
+            )
+            for name, create in (("legacy", legacy_create_quiz_session), ("executemany", crud_quiz.create_quiz_session)):
+                timings = []
+                for _ in range(args.repeat):
+                    db = SessionLocal()
+                    statements["count"] = 0
+                    started = time.perf_counter()
+                    session = create(db, user_id, session_data)
+                    # What the route does next: serialize the returned session
+                    _ = (session.id, session.created_at, session.num_questions, session.score)
+                    timings.append(time.perf_counter() - started)
+                    db.close()
+                print(f"{size:>9}  {name:<14} {statistics.median(timings) * 1000:>10.1f} {statements['count']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="25,500,5000", type=lambda v: [int(n) for n in v.split(",")])
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Seed a replay cassette from the generations stored in the configured database.
+
+    python -m benchmarks.seed_cassette OUT.jsonl [--limit N]
+
+Each stored quiz (or raw model response, where prompt logs kept them) becomes
+one recorded response filed under its prompt's topic, so replaying a prompt on
+that topic serves real generated questions.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.services.cassettes import Cassette  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out")
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        cassette = Cassette.from_prompt_responses(db, limit=args.limit)
+    finally:
+        db.close()
+    cassette.save(args.out)
+    topics = {entry["topic"] for entry in cassette.entries}
+    print(f"Wrote {len(cassette)} responses over {len(topics)} topics to {args.out}")
+
+
+if __name__ == "__main__":
+    main()